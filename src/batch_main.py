@@ -0,0 +1,106 @@
+import argparse
+
+
+def get_parser() -> argparse.ArgumentParser:
+    from utils.chroma_utils.chroma_backends import CHROMA_BACKENDS
+
+    parser = argparse.ArgumentParser(
+        description="Headless key/BPM analysis over audio files, directories or globs."
+    )
+    parser.add_argument("inputs", nargs="+", help="Audio files, directories or glob patterns")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    parser.add_argument("-f", "--format", choices=["jsonl", "csv"], default="jsonl")
+    parser.add_argument("-w", "--workers", type=int, default=0, help="Worker processes (default: all cores)")
+    parser.add_argument("--chroma-dir", help="Save each processed chromagram as .npy here")
+    parser.add_argument("--midi-dir", help="Save each chromagram converted to MIDI here")
+
+    parser.add_argument("--hpass", type=int, default=1000, help="High-pass cutoff in Hz, 0 to disable")
+    parser.add_argument("--lpass", type=int, default=2000, help="Low-pass cutoff in Hz, 0 to disable")
+    parser.add_argument("--no-instrument-filter", action="store_true", help="Skip harmonic separation")
+    parser.add_argument("--no-bpm", action="store_true", help="Skip tempo estimation")
+    parser.add_argument(
+        "--chroma-backend",
+        choices=CHROMA_BACKENDS,
+        default="cqt",
+        help="cqt_reduced and stft trade key accuracy for speed",
+    )
+
+    parser.add_argument(
+        "--beat-sync",
+        type=int,
+        default=0,
+        help="Aggregate chroma per beat split into this many steps, 0 to disable",
+    )
+
+    parser.add_argument(
+        "--key-track",
+        action="store_true",
+        help="Also report key segments over time, for mixes and modulating tracks",
+    )
+
+    parser.add_argument("--abs-filter", action="store_true")
+    parser.add_argument("--nn-filter", action="store_true")
+    parser.add_argument(
+        "--smoothing",
+        type=float,
+        default=0,
+        help="Median smoothing width in STFT frames, kept in time with --beat-sync, 0 to disable",
+    )
+    parser.add_argument("--min-clip", type=float, default=0, help="Minimum chroma value, 0 to disable")
+    return parser
+
+
+if __name__ == "__main__":
+    import sys
+    import logging
+    import multiprocessing
+
+    logging.basicConfig(level=logging.INFO)
+    multiprocessing.freeze_support()
+
+    from multiprocessing import cpu_count
+    from utils.shared_dcs import AudioPipeline, ChromaPipeline
+    from utils.batch_utils.batch_analysis import (
+        BatchAnalyzer,
+        BatchWriter,
+        collect_audio_files,
+    )
+
+    args = get_parser().parse_args()
+
+    adpl = AudioPipeline(
+        hpass_fl_state=args.hpass > 0,
+        hpass_val=args.hpass,
+        lpass_fl_state=args.lpass > 0,
+        lpass_val=args.lpass,
+        inst_fl_state=not args.no_instrument_filter,
+        save_out_state=False,
+        calc_bpm_state=not args.no_bpm,
+        core_count=1,
+        chroma_backend=args.chroma_backend,
+        beat_sync_state=args.beat_sync > 0,
+        beat_sync_val=max(args.beat_sync, 1),
+    )
+    chpl = ChromaPipeline(
+        abs_fl_state=args.abs_filter,
+        nn_fl_state=args.nn_filter,
+        mds_fl_state=args.smoothing > 0,
+        mds_val=args.smoothing,
+        min_clip_fl_state=args.min_clip > 0,
+        min_clip_val=args.min_clip,
+    )
+
+    files = collect_audio_files(args.inputs)
+    if not files:
+        logging.error("No audio files found")
+        sys.exit(1)
+
+    analyzer = BatchAnalyzer(adpl, chpl, workers=args.workers or cpu_count())
+    jobs = analyzer.get_jobs(
+        files, chroma_dir=args.chroma_dir, midi_dir=args.midi_dir, key_track=args.key_track
+    )
+    with BatchWriter(args.output, args.format) as writer:
+        failed = analyzer.run(jobs, writer)
+
+    logging.info(f"Analysed {len(files) - failed}/{len(files)} files")
+    sys.exit(1 if failed else 0)
@@ -1,21 +1,32 @@
 if __name__ == "__main__":
+    import os
     import logging
-    import matplotlib
     import multiprocessing
+    from utils.startup_utils import StartupTimer
 
+    startup_timer = StartupTimer()
     logging.basicConfig(level=logging.INFO)
-    matplotlib.use("QtAgg")
+    # Selects the backend without importing matplotlib before the first paint.
+    os.environ.setdefault("MPLBACKEND", "QtAgg")
     multiprocessing.freeze_support()
 
     import sys
     import traceback
-    from window_main import Main
     from PyQt6 import QtWidgets
 
+    startup_timer.mark("import qt")
+    from window_main import Main
+
+    startup_timer.mark("import window_main")
+
     try:
         app = QtWidgets.QApplication(sys.argv)
         window = Main()
+        startup_timer.mark("build window")
         window.show()
+        warm_up_state = "--no-warm-up" not in sys.argv
+        warm_up_pool_state = "--warm-up-pool" in sys.argv
+        window.start_deferred_loading(startup_timer, warm_up_state, warm_up_pool_state)
         app.exec()
 
     except Exception as error:
@@ -0,0 +1,105 @@
+import os
+import atexit
+import logging
+import threading
+import numpy as np
+
+from multiprocessing import shared_memory, resource_tracker
+from multiprocessing.pool import Pool
+from typing import Callable, Optional
+
+from utils.shared_dcs import SharedArraySpec
+
+
+class SharedArray:
+    """
+    NumPy array backed by a multiprocessing.shared_memory block. Workers
+    receive only the SharedArraySpec and attach to the same buffer.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, spec: SharedArraySpec):
+        self.shm = shm
+        self.spec = spec
+        self.array = np.ndarray(spec.shape, dtype=spec.dtype, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, shape: tuple[int, ...], dtype="float32"):
+        dtype = np.dtype(dtype)
+        nbytes = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        spec = SharedArraySpec(name=shm.name, shape=tuple(shape), dtype=dtype.str)
+        return cls(shm, spec)
+
+    @classmethod
+    def from_array(cls, array: np.ndarray):
+        shared = cls.create(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, spec: SharedArraySpec):
+        shm = shared_memory.SharedMemory(name=spec.name)
+        return cls(shm, spec)
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        self.shm.unlink()
+
+
+class AnalysisPool:
+    """
+    Long-lived worker pool shared by every analysis job of an application
+    run, so "Start Processing" does not pay process start-up per job.
+    Workers run INITIALIZER(*INITARGS) once when they start.
+    """
+
+    pool: Optional[Pool] = None
+    processes: int = 0
+    initializer: Optional[Callable] = None
+    initargs: tuple = ()
+    lock = threading.Lock()
+
+    @classmethod
+    def get_pool(cls, processes: int) -> Pool:
+        with cls.lock:
+            if cls.pool is None or processes > cls.processes:
+                cls.close_pool()
+                logging.info(f"AnalysisPool:get_pool - starting {processes} workers")
+                if os.name == "posix":
+                    # Workers must share the parent's tracker, otherwise each one
+                    # reports the blocks it attached to as leaked on exit.
+                    resource_tracker.ensure_running()
+                cls.pool = Pool(processes=processes, initializer=cls.initializer, initargs=cls.initargs)
+                cls.processes = processes
+            return cls.pool
+
+    @classmethod
+    def map_jobs(cls, job_fn, jobs: list, processes: int) -> list:
+        # A single job or a single process runs in-process, so short files
+        # and one-core runs never start the pool.
+        if len(jobs) <= 1 or processes <= 1:
+            return [job_fn(job) for job in jobs]
+        pool = cls.get_pool(processes)
+        return list(pool.imap_unordered(job_fn, jobs, chunksize=1))
+
+    @classmethod
+    def close_pool(cls):
+        # Callers hold cls.lock.
+        if cls.pool is not None:
+            logging.info("AnalysisPool:shutdown")
+            cls.pool.terminate()
+            cls.pool.join()
+            cls.pool = None
+            cls.processes = 0
+
+    @classmethod
+    def shutdown(cls):
+        with cls.lock:
+            cls.close_pool()
+
+
+atexit.register(AnalysisPool.shutdown)
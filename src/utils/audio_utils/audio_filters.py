@@ -0,0 +1,52 @@
+import logging
+import numpy as np
+
+from utils.shared_dcs import AudioPipeline
+
+
+# First-order sections keep the 6dB/octave slope of the pydub filters
+# this engine replaces.
+FILTER_ORDER = 1
+BLOCK_SIZE = 1 << 20
+
+
+class IIRFilterBank:
+    """
+    Cascade of second-order sections which carries its state from one block
+    to the next, so blocked or streamed output matches a single pass exactly.
+    """
+
+    def __init__(self, sos: np.ndarray):
+        self.sos = sos
+        self.zi = np.zeros((sos.shape[0], 2))
+
+    @classmethod
+    def from_adpl(cls, adpl: AudioPipeline, sr: int, order: int = FILTER_ORDER):
+        from scipy.signal import butter
+
+        sections = []
+        nyquist = sr / 2
+        if adpl.lpass_fl_state and 0 < adpl.lpass_val < nyquist:
+            sections.append(butter(order, adpl.lpass_val, "lowpass", fs=sr, output="sos"))
+        if adpl.hpass_fl_state and 0 < adpl.hpass_val < nyquist:
+            sections.append(butter(order, adpl.hpass_val, "highpass", fs=sr, output="sos"))
+        if not sections:
+            return None
+        return cls(np.concatenate(sections, axis=0))
+
+    def reset(self):
+        self.zi = np.zeros((self.sos.shape[0], 2))
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        from scipy.signal import sosfilt
+
+        y, self.zi = sosfilt(self.sos, block, zi=self.zi)
+        return y.astype(block.dtype, copy=False)
+
+    def process_blocks(self, y: np.ndarray, block_size: int = BLOCK_SIZE) -> np.ndarray:
+        logging.info("IIRFilterBank:process_blocks")
+        y_out = np.empty_like(y)
+        for start in range(0, y.shape[0], block_size):
+            end = start + block_size
+            y_out[start:end] = self.process(y[start:end])
+        return y_out
@@ -0,0 +1,126 @@
+import wave
+import struct
+import logging
+import numpy as np
+
+from io import BytesIO
+
+from utils.shared_dcs import AudioBuffer
+
+
+ANALYSIS_SAMPLE_RATE = 22050
+# Frames converted at a time when writing WAV bytes for the player.
+WAV_BLOCK_FRAMES = 1 << 16
+WAV_HEADER_SIZE = 44
+
+
+class AudioIngest:
+    """
+    Decodes audio once into a float32 AudioBuffer of shape (channels, frames)
+    which the player, the filter stage and the chroma stage all read from.
+    """
+
+    @staticmethod
+    def from_file(file: str) -> AudioBuffer:
+        logging.info("AudioIngest:from_file")
+        from pydub import AudioSegment
+
+        pyd_audio = AudioSegment.from_file(file)
+        samples = AudioIngest.pcm_to_float(
+            pyd_audio.raw_data, pyd_audio.sample_width, pyd_audio.channels
+        )
+        return AudioBuffer(samples=samples, sample_rate=pyd_audio.frame_rate)
+
+    @staticmethod
+    def from_wav_io(audio_io: BytesIO) -> AudioBuffer:
+        logging.info("AudioIngest:from_wav_io")
+        audio_io.seek(0)
+        with wave.open(audio_io, "rb") as wave_io:
+            channels = wave_io.getnchannels()
+            sample_width = wave_io.getsampwidth()
+            sample_rate = wave_io.getframerate()
+            data = wave_io.readframes(wave_io.getnframes())
+        samples = AudioIngest.pcm_to_float(data, sample_width, channels)
+        return AudioBuffer(samples=samples, sample_rate=sample_rate)
+
+    @staticmethod
+    def pcm_to_float(data: bytes, sample_width: int, channels: int) -> np.ndarray:
+        if sample_width == 1:
+            pcm = np.frombuffer(data, dtype=np.uint8)
+            samples = pcm.astype(np.float32)
+            samples -= 128.0
+            samples /= 128.0
+        elif sample_width == 2:
+            pcm = np.frombuffer(data, dtype=np.int16)
+            samples = pcm.astype(np.float32)
+            samples /= 32768.0
+        elif sample_width == 4:
+            pcm = np.frombuffer(data, dtype=np.int32)
+            samples = (pcm / 2147483648.0).astype(np.float32)
+        else:
+            raise ValueError(f"Unsupported sample width: {sample_width}")
+        return samples.reshape(-1, channels).T
+
+    @staticmethod
+    def get_wav_header(channels: int, sample_rate: int, data_size: int) -> bytes:
+        block_align = channels * 2
+        return struct.pack(
+            "<4sI4s4sIHHIIHH4sI",
+            b"RIFF",
+            WAV_HEADER_SIZE - 8 + data_size,
+            b"WAVE",
+            b"fmt ",
+            16,
+            1,
+            channels,
+            sample_rate,
+            sample_rate * block_align,
+            block_align,
+            16,
+            b"data",
+            data_size,
+        )
+
+    @staticmethod
+    def to_wav_bytes(audio_buffer: AudioBuffer) -> bytearray:
+        """
+        16-bit PCM WAV of AUDIO_BUFFER, converted WAV_BLOCK_FRAMES at a time
+        straight into one preallocated buffer.
+        """
+        logging.info("AudioIngest:to_wav_bytes")
+        samples = audio_buffer.samples
+        channels, n_frames = samples.shape
+        data_size = n_frames * channels * 2
+
+        wav_bytes = bytearray(WAV_HEADER_SIZE + data_size)
+        wav_bytes[:WAV_HEADER_SIZE] = AudioIngest.get_wav_header(
+            channels, int(audio_buffer.sample_rate), data_size
+        )
+        pcm = np.frombuffer(wav_bytes, dtype="<i2", offset=WAV_HEADER_SIZE)
+        pcm = pcm.reshape(n_frames, channels)
+
+        block = np.empty((min(WAV_BLOCK_FRAMES, n_frames), channels), dtype=np.float32)
+        for start in range(0, n_frames, WAV_BLOCK_FRAMES):
+            end = min(start + WAV_BLOCK_FRAMES, n_frames)
+            block_view = block[: end - start]
+            np.clip(samples[:, start:end].T, -1.0, 1.0, out=block_view)
+            block_view *= 32767.0
+            pcm[start:end] = block_view
+        return wav_bytes
+
+    @staticmethod
+    def get_mono(audio_buffer: AudioBuffer) -> np.ndarray:
+        samples = audio_buffer.samples
+        if samples.shape[0] == 1:
+            return samples[0]
+        return samples.mean(axis=0, dtype=np.float32)
+
+    @staticmethod
+    def resample(y: np.ndarray, sr: int, target_sr: int = ANALYSIS_SAMPLE_RATE):
+        if sr == target_sr:
+            return y
+        import librosa
+
+        y = librosa.resample(y, orig_sr=sr, target_sr=target_sr)
+        return y.astype(np.float32, copy=False)
+
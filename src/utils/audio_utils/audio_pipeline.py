@@ -1,16 +1,19 @@
 import os
-import io
+import math
 import logging
-import librosa
 import numpy as np
-import soundfile as sf
 
-from io import BytesIO
-from pydub import AudioSegment
-from copy import deepcopy
+from typing import Optional
 
-from utils.shared_dcs import AudioDecomp, AudioPipeline
-from multiprocessing.pool import Pool
+from utils.shared_dcs import AudioBuffer, AudioDecomp, AudioPipeline, AudioSpectra, LibrLoadJob
+from utils.audio_utils.audio_ingest import AudioIngest, ANALYSIS_SAMPLE_RATE
+from utils.audio_utils.audio_filters import IIRFilterBank
+from utils.audio_utils.analysis_pool import AnalysisPool, SharedArray
+from utils.audio_utils.chunk_scheduler import ChunkScheduler, ENVELOPE_HOP
+from utils.audio_utils.spectral_frontend import SpectralFrontEnd
+from utils.chroma_utils.chroma_cqt import TuningTracker
+from utils.chroma_utils.chroma_backends import compute_chromas
+from utils.chroma_utils.chroma_beat_sync import BeatSync
 
 
 os.environ["OMP_NUM_THREADS"] = "1"
@@ -20,67 +23,175 @@ os.environ["VECLIB_MAXIMUM_THREADS"] = "1"
 os.environ["NUMEXPR_NUM_THREADS"] = "1"
 
 
+# Samples of context (at the analysis rate) shared with each neighbouring
+# chunk. Covers the 31-frame HPSS median filter, the 2048-sample STFT window
+# and the resampling filter, so chunk interiors match a single pass.
+HPSS_CONTEXT = 48 * 512
+
+
+def libr_load_job(job: LibrLoadJob) -> int:
+    shared_in = SharedArray.attach(job.in_spec)
+    shared_out = SharedArray.attach(job.out_spec)
+    try:
+        y_slice = shared_in.array[job.start : job.end]
+        y, _ = ChromaMT(job.adpl).libr_load(y_slice, job.sample_rate)
+        del y_slice
+
+        n_out = job.out_end - job.out_start
+        y_out = y[job.out_offset : job.out_offset + n_out]
+        shared_out.array[job.out_start : job.out_end] = y_out
+        return n_out
+    finally:
+        shared_in.close()
+        shared_out.close()
+
+
+class SilenceTrim:
+    """
+    Leading/trailing silence detector matching librosa.effects.trim with
+    hop_length=1, using running sums over blocks instead of one RMS frame
+    per sample. Only the edges are scanned once the reference is known.
+    """
+
+    def __init__(self, top_db: float = 60, frame_length: int = 16, block_size: int = 1 << 20):
+        self.top_db = top_db
+        self.frame_length = frame_length
+        self.block_size = block_size
+        self.amin = 1e-10
+
+    def get_frame_power(self, y: np.ndarray, f_start: int, f_end: int) -> np.ndarray:
+        # Frame i is centered on sample i and zero-padded, as librosa's rms is.
+        half = self.frame_length // 2
+        seg_start = f_start - half
+        seg = np.zeros(f_end - f_start + self.frame_length - 1, dtype=np.float64)
+        lo, hi = max(seg_start, 0), min(seg_start + seg.shape[0], y.shape[0])
+        if hi > lo:
+            seg[lo - seg_start : hi - seg_start] = y[lo:hi]
+
+        power_sum = np.concatenate(([0.0], np.cumsum(seg * seg)))
+        length = self.frame_length
+        return (power_sum[length:] - power_sum[:-length]) / length
+
+    def get_loud_frames(self, y, f_start: int, f_end: int, threshold: float):
+        power = self.get_frame_power(y, f_start, f_end)
+        return np.maximum(power, self.amin) > threshold
+
+    def get_frame_blocks(self, n_frames: int, reverse: bool = False):
+        starts = range(0, n_frames, self.block_size)
+        if reverse:
+            starts = reversed(starts)
+        for f_start in starts:
+            yield f_start, min(f_start + self.block_size, n_frames)
+
+    def get_bounds(self, y: np.ndarray) -> tuple[int, int]:
+        logging.info("SilenceTrim:get_bounds")
+        n_frames = y.shape[0] + 1
+        ref = 0.0
+        for f_start, f_end in self.get_frame_blocks(n_frames):
+            ref = max(ref, float(self.get_frame_power(y, f_start, f_end).max()))
+
+        threshold = max(self.amin, ref) * 10.0 ** (-self.top_db / 10.0)
+
+        start = None
+        for f_start, f_end in self.get_frame_blocks(n_frames):
+            loud = np.flatnonzero(self.get_loud_frames(y, f_start, f_end, threshold))
+            if loud.size:
+                start = f_start + int(loud[0])
+                break
+        if start is None:
+            return 0, 0
+
+        end = start + 1
+        for f_start, f_end in self.get_frame_blocks(n_frames, reverse=True):
+            loud = np.flatnonzero(self.get_loud_frames(y, f_start, f_end, threshold))
+            if loud.size:
+                end = f_start + int(loud[-1]) + 1
+                break
+        return start, min(end, y.shape[0])
+
+    def trim(self, y: np.ndarray) -> np.ndarray:
+        start, end = self.get_bounds(y)
+        return y[start:end]
+
+
 class ChromaMT:
+    """
+    Runs HPSS over chunks in the AnalysisPool. Each chunk's harmonic STFT is
+    dropped in its worker, as the stitched signal is then normalised and
+    trimmed off the frame grid. Tempo, beats and STFT chroma therefore
+    recompute a full STFT serially, unlike ChromaST.
+    """
+
     def __init__(self, adpl: AudioPipeline):
         self.adpl = adpl
+        self.scheduler = ChunkScheduler(adpl.core_count)
+        self.frontend = SpectralFrontEnd()
 
-    def get_audio_decomp(self, input_io):
+    def get_audio_decomp(self, audio_buffer: AudioBuffer):
         logging.info("ChromaMT:get_audio_decomp")
-        pyd_audio_in = AudioSegment.from_file(
-            input_io, format="wav", codec="pcm_s16le"
-        )
-        pyd_io = BytesIO()
-        pyd_audio_in.export(pyd_io, format="wav", codec="pcm_s16le")
-
-        y, sr = librosa.load(pyd_io)
+        y = AudioIngest.get_mono(audio_buffer)
+        sr = audio_buffer.sample_rate
 
-        pyd_audio = self.pyd_pipeline(pyd_audio_in)
-        y, sr = self.libr_pipeline(pyd_audio)
+        y = self.filter_pipeline(y, sr)
+        y, sr = self.libr_pipeline(y, sr)
+        spectra = self.frontend.get_spectra(y, sr)
 
         if self.adpl.save_out_state:
+            import soundfile as sf
+
             sf.write("output.wav", data=y, samplerate=sr)
 
-        chromas = self.compute_chromas(y, sr)
-        bpm = self.get_bpm(y)
+        chromas = self.compute_chromas(spectra)
+        bpm = self.get_bpm(spectra)
+
+        column_times = None
+        if self.adpl.beat_sync_state:
+            chromas, column_times = self.beat_sync(chromas, spectra, bpm)
 
         audio_decomp = AudioDecomp(
             chromas=chromas,
             audio_array=y,
             sample_rate=sr,
             bpm=bpm,
+            column_times=column_times,
         )
         return audio_decomp
 
-    def get_bpm(self, audio_array: np.ndarray):
-        if self.adpl.calc_bpm_state:
-            bpm = librosa.beat.tempo(y=audio_array).flatten()[0]
+    def get_bpm(self, spectra: AudioSpectra):
+        # The beat grid needs the tempo whether or not it is reported.
+        if self.adpl.calc_bpm_state or self.adpl.beat_sync_state:
+            bpm = self.frontend.get_tempo(spectra)
             bpm = round(bpm, 2)
             return bpm
         return 0
 
-    def low_high_filters(self, audio):
+    def beat_sync(self, chromas: np.ndarray, spectra: AudioSpectra, bpm: float):
+        logging.info("ChromaMT:beat_sync")
+        beat_frames = self.frontend.get_beat_frames(spectra, bpm or None)
+        beat_sync = BeatSync(self.adpl.beat_sync_val)
+        return beat_sync.sync(chromas, beat_frames, spectra.sample_rate, self.frontend.hop_length)
+
+    def low_high_filters(self, y: np.ndarray, sr: int) -> np.ndarray:
         logging.info("ChromaMT:low_high_filters")
-        if self.adpl.lpass_fl_state:
-            audio = audio.low_pass_filter(self.adpl.lpass_val)
-        if self.adpl.hpass_fl_state:
-            audio = audio.high_pass_filter(self.adpl.hpass_val)
-        return audio
+        filter_bank = IIRFilterBank.from_adpl(self.adpl, sr)
+        if filter_bank is not None:
+            y = filter_bank.process_blocks(y)
+        return y
 
-    def libr_load(self, audio):
+    def libr_load(self, y: np.ndarray, sr: int):
         logging.info("ChromaMT:libr_load")
-        audioBytes = io.BytesIO()
-        audio.export(audioBytes, format="wav", codec="pcm_s16le")
-        y, sr = librosa.load(audioBytes)
+        y = AudioIngest.resample(y, sr)
+        sr = ANALYSIS_SAMPLE_RATE
 
-        y = librosa.util.normalize(S=y) * 0.8
         if self.adpl.inst_fl_state:
-            y_harmonic = librosa.effects.harmonic(y=y, margin=1)
-            y = y_harmonic
+            spectra = self.frontend.get_spectra(y, sr)
+            y = self.frontend.harmonic(spectra, margin=1).samples
+        return y, sr
+
+    def libr_normalize(self, y: np.ndarray) -> np.ndarray:
+        import librosa
 
-        y_trim, _ = librosa.effects.trim(y=y, frame_length=16, top_db=60, hop_length=1)
-        self.libr_fadein(y_trim, sr, duration=0.005)
-        self.libr_fadeout(y_trim, sr, duration=0.005)
-        return y_trim, sr
+        return librosa.util.normalize(S=y)
 
     def libr_fadeout(self, audio, sr, duration=3.0):
         logging.info("ChromaMT:libr_fadeout")
@@ -97,16 +208,6 @@ class ChromaMT:
         fade_curve = np.linspace(0.0, 1.0, end)
         audio[start:end] = audio[start:end] * fade_curve
 
-    def get_segment_ranges(self, n_frames: int) -> list[tuple[int, int]]:
-        logging.info("ChromaMT:get_segment_ranges")
-        frame_per_div = int(n_frames // self.adpl.core_count)
-        num = 0
-        segments = []
-        for _ in range(self.adpl.core_count):
-            segments.append((num, num + frame_per_div))
-            num += frame_per_div
-        return segments
-
     def get_bar_count(self, audio, bpm):
         logging.info("ChromaMT:get_bar_count")
         audio_duration = audio.duration_seconds
@@ -116,127 +217,168 @@ class ChromaMT:
         bars = audio_duration / bar_sec
         return bars
 
-    def get_pyd_slices(self, pyd_audio):
-        logging.info("ChromaMT:get_pyd_slices")
-        n_frames = int(pyd_audio.frame_count())
-        segment_ranges = self.get_segment_ranges(n_frames)
-        pyd_slices = []
-        for st_slice, en_slice in segment_ranges:
-            pyd_slice = pyd_audio.get_sample_slice(
-                start_sample=st_slice, end_sample=en_slice
+    def filter_pipeline(self, y: np.ndarray, sr: int) -> np.ndarray:
+        logging.info("ChromaMT:filter_pipeline")
+        return self.low_high_filters(y, sr)
+
+    def get_libr_jobs(self, shared_in: SharedArray, shared_out: SharedArray, sr: int):
+        n_in = shared_in.spec.shape[0]
+        n_out = shared_out.spec.shape[0]
+
+        # Chunk starts must map to whole samples at both rates and to whole
+        # STFT frames, so every chunk sees the same grid as a single pass.
+        rate_gcd = math.gcd(sr, ANALYSIS_SAMPLE_RATE)
+        q_in, q_out = sr // rate_gcd, ANALYSIS_SAMPLE_RATE // rate_gcd
+        align = math.lcm(512, q_out)
+        context_out = math.ceil(HPSS_CONTEXT / align) * align
+        context_in = context_out * q_in // q_out
+
+        bounds = self.scheduler.get_bounds(n_out, ANALYSIS_SAMPLE_RATE, align)
+        quiet = [
+            self.scheduler.is_quiet(bound, ANALYSIS_SAMPLE_RATE, context_out)
+            for bound in bounds
+        ]
+
+        jobs = []
+        for idx, (out_start, out_end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            # Seams in silence need no shared context.
+            start_context = 0 if quiet[idx] else context_in
+            end_context = 0 if quiet[idx + 1] else context_in
+            start = max(out_start * q_in // q_out - start_context, 0)
+            end = n_in
+            if out_end < n_out:
+                end = min(out_end * q_in // q_out + end_context, n_in)
+            job = LibrLoadJob(
+                adpl=self.adpl,
+                sample_rate=sr,
+                in_spec=shared_in.spec,
+                start=start,
+                end=end,
+                out_spec=shared_out.spec,
+                out_start=out_start,
+                out_end=out_end,
+                out_offset=out_start - start * q_out // q_in,
             )
-            pyd_slices.append(pyd_slice)
-        return pyd_slices
-
-    def pyd_pipeline(self, pyd_audio):
-        logging.info("ChromaMT:pyd_pipeline")
-        if self.adpl.hpass_fl_state or self.adpl.lpass_fl_state:
-            pyd_slices = self.get_pyd_slices(pyd_audio)
-            pool = Pool(processes=self.adpl.core_count)
-            pyd_slices = pool.map(self.low_high_filters, pyd_slices)
-            len_segments = len(pyd_slices)
-            pool.close()
-            pyd_segment = AudioSegment.empty()
-            for idx, chunk in enumerate(pyd_slices):
-                logging.info(f"Processing Chunk (PyDub) {idx}/{len_segments}")
-                chunk_ms = chunk.duration_seconds * 1000
-                if not len(pyd_segment):
-                    pyd_segment = chunk
-                elif chunk_ms <= 2:
-                    pyd_segment = pyd_segment.append(chunk, crossfade=0)
-                else:
-                    pyd_segment = pyd_segment.append(chunk, crossfade=2)
-            return pyd_segment
-        return pyd_audio
-
-    def libr_pipeline(self, pyd_audio):
+            jobs.append(job)
+        return jobs
+
+    def libr_pipeline(self, y: np.ndarray, sr: int):
         logging.info("ChromaMT:libr_pipeline")
-        pyd_slices = self.get_pyd_slices(pyd_audio)
-        pool = Pool(processes=self.adpl.core_count)
-        libr_slices = pool.map(self.libr_load, pyd_slices)
-        len_slices = len(libr_slices)
-        pool.close()
-
-        allArrays = np.array([])
-        for idx, (y, sr) in enumerate(libr_slices):
-            logging.info(f"Processing Chunk (Librosa) - {idx}/{len_slices}")
-            allArrays = np.concatenate([allArrays, y])
-        y, sr = allArrays, libr_slices[0][1]
+        n_out = int(np.ceil(y.shape[0] * ANALYSIS_SAMPLE_RATE / sr))
+        envelope = ChunkScheduler.get_envelope(y)
+        self.scheduler.set_envelope(envelope, sr / ENVELOPE_HOP)
+
+        shared_in = SharedArray.from_array(y.astype(np.float32, copy=False))
+        shared_out = SharedArray.create((n_out,), np.float32)
+        try:
+            jobs = self.get_libr_jobs(shared_in, shared_out, sr)
+            logging.info(f"Processing Chunks (Librosa) - {len(jobs)}")
+            AnalysisPool.map_jobs(libr_load_job, jobs, self.adpl.core_count)
+            y = shared_out.array.copy()
+        finally:
+            shared_in.unlink()
+            shared_out.unlink()
+
+        sr = ANALYSIS_SAMPLE_RATE
+        y = self.libr_normalize(y)
+        trim_start, trim_end = SilenceTrim().get_bounds(y)
+        y = y[trim_start:trim_end]
+        self.scheduler.shift_envelope(trim_start / sr)
+        self.libr_fadein(y, sr, duration=0.005)
+        self.libr_fadeout(y, sr, duration=0.005)
         return y, sr
 
-    def compute_chromas(self, y, sr):
+    def compute_chromas(self, spectra: AudioSpectra):
         logging.info("ChromaMT:compute_chromas")
-        chromas_cqt = librosa.feature.chroma_cqt(
-            y=y, sr=sr, n_chroma=12, threshold=5, bins_per_octave=36
-        )
-        return chromas_cqt
+        scheduler = self.scheduler if self.adpl.par_chroma_state else None
+        return compute_chromas(spectra, self.frontend, self.adpl.chroma_backend, scheduler=scheduler)
 
 
 class ChromaST:
-    def __init__(self, adpl: AudioPipeline):
+    def __init__(
+        self,
+        adpl: AudioPipeline,
+        filter_bank: Optional[IIRFilterBank] = None,
+        tuning_tracker: Optional[TuningTracker] = None,
+    ):
         self.adpl = adpl
+        self.filter_bank = filter_bank
+        self.tuning_tracker = tuning_tracker
+        self.frontend = SpectralFrontEnd()
 
-    def get_audio_decomp(self, input_io: BytesIO):
+    def get_audio_decomp(self, audio_buffer: AudioBuffer):
         logging.info("ChromaST:get_audio_decomp")
-        pyd_audio_in = AudioSegment.from_file(input_io, format="wav", codec="pcm_s16le")
+        y = AudioIngest.get_mono(audio_buffer)
+        sr = audio_buffer.sample_rate
 
-        pyd_audio = self.pyd_pipeline(pyd_audio_in)
-        y, sr = self.libr_pipeline(pyd_audio)
+        y = self.filter_pipeline(y, sr)
+        spectra = self.libr_pipeline(y, sr)
+        y, sr = spectra.samples, spectra.sample_rate
 
         if self.adpl.save_out_state:
+            import soundfile as sf
+
             sf.write("output.wav", data=y, samplerate=sr)
 
-        chromas = self.compute_chromas(y, sr)
-        bpm = self.get_bpm(y)
+        chromas = self.compute_chromas(spectra)
+        bpm = self.get_bpm(spectra)
+
+        column_times = None
+        if self.adpl.beat_sync_state:
+            chromas, column_times = self.beat_sync(chromas, spectra, bpm)
 
         audio_decomp = AudioDecomp(
             chromas=chromas,
             audio_array=y,
             sample_rate=sr,
             bpm=bpm,
+            column_times=column_times,
         )
         return audio_decomp
 
-    def get_bpm(self, audio_array: np.ndarray):
-        if self.adpl.calc_bpm_state:
-            bpm = librosa.beat.tempo(y=audio_array).flatten()[0]
+    def get_bpm(self, spectra: AudioSpectra):
+        # The beat grid needs the tempo whether or not it is reported.
+        if self.adpl.calc_bpm_state or self.adpl.beat_sync_state:
+            bpm = self.frontend.get_tempo(spectra)
             bpm = round(bpm, 2)
             return bpm
         return 0
 
-    def low_high_filters(self, pyd_audio):
+    def beat_sync(self, chromas: np.ndarray, spectra: AudioSpectra, bpm: float):
+        logging.info("ChromaST:beat_sync")
+        beat_frames = self.frontend.get_beat_frames(spectra, bpm or None)
+        beat_sync = BeatSync(self.adpl.beat_sync_val)
+        return beat_sync.sync(chromas, beat_frames, spectra.sample_rate, self.frontend.hop_length)
+
+    def low_high_filters(self, y: np.ndarray, sr: int) -> np.ndarray:
         logging.info("ChromaST:low_high_filters")
-        if self.adpl.lpass_fl_state:
-            pyd_audio = pyd_audio.low_pass_filter(self.adpl.lpass_val)
-        if self.adpl.hpass_fl_state:
-            pyd_audio = pyd_audio.high_pass_filter(self.adpl.hpass_val)
-        return pyd_audio
+        if self.filter_bank is None:
+            self.filter_bank = IIRFilterBank.from_adpl(self.adpl, sr)
+        if self.filter_bank is not None:
+            y = self.filter_bank.process(y)
+        return y
 
-    def libr_harmonic(self, pyd_audio) -> tuple[np.ndarray, float]:
+    def libr_harmonic(self, y: np.ndarray, sr: int) -> AudioSpectra:
         logging.info("ChromaST:libr_harmonic")
-        audio_io = BytesIO()
-        pyd_audio.export(audio_io, format="wav", codec="pcm_s16le")
+        y = AudioIngest.resample(y, sr)
+        spectra = self.frontend.get_spectra(y, ANALYSIS_SAMPLE_RATE)
 
-        y, sr = librosa.load(audio_io)
         if self.adpl.inst_fl_state:
-            y = librosa.effects.harmonic(y=y, margin=1)
+            spectra = self.frontend.harmonic(spectra, margin=1)
 
-        y = librosa.util.normalize(S=y)
-        return y, sr
+        return self.frontend.normalize(spectra)
 
-    def pyd_pipeline(self, pyd_audio):
-        logging.info("ChromaST:pyd_pipeline")
-        pyd_audio = self.low_high_filters(pyd_audio)
-        return pyd_audio
+    def filter_pipeline(self, y: np.ndarray, sr: int) -> np.ndarray:
+        logging.info("ChromaST:filter_pipeline")
+        return self.low_high_filters(y, sr)
 
-    def libr_pipeline(self, pyd_audio) -> tuple[np.ndarray, float]:
+    def libr_pipeline(self, y: np.ndarray, sr: int) -> AudioSpectra:
         logging.info("ChromaST:libr_pipeline")
-        y, sr = self.libr_harmonic(pyd_audio)
-        return y, sr
+        return self.libr_harmonic(y, sr)
 
-    def compute_chromas(self, y, sr) -> np.ndarray:
+    def compute_chromas(self, spectra: AudioSpectra) -> np.ndarray:
         logging.info("ChromaST:compute_chromas")
-        chromas_cqt = librosa.feature.chroma_cqt(
-            y=y, sr=sr, n_chroma=12, threshold=5, bins_per_octave=36
-        )
-        return chromas_cqt
+        tuning = None
+        if self.tuning_tracker is not None:
+            tuning = self.tuning_tracker.update(spectra.samples, spectra.sample_rate)
+        return compute_chromas(spectra, self.frontend, self.adpl.chroma_backend, tuning)
@@ -0,0 +1,132 @@
+import math
+import logging
+import numpy as np
+
+
+# Chunks shorter than this spend more time on their context margins than on
+# the audio they own.
+MIN_CHUNK_SECONDS = 30.0
+# Upper bound on a chunk, which keeps per-worker STFT memory bounded.
+MAX_CHUNK_SECONDS = 300.0
+# More chunks than workers lets the pool hand out work dynamically, so one
+# slow chunk does not hold up the whole job.
+CHUNKS_PER_WORKER = 3
+# How far a boundary may move from its ideal position to reach a quieter
+# point, and how quiet (relative to the loudest frame) counts as silence.
+SPLIT_SEARCH_SECONDS = 5.0
+QUIET_DB = -60.0
+# Boundaries are ranked by the loudest frame within this many seconds, which
+# is wider than any stage's context, so a quiet seam is quiet on both sides.
+SEAM_SECONDS = 2.0
+ENVELOPE_HOP = 1024
+
+
+class ChunkScheduler:
+    """
+    Picks the chunk count and chunk bounds for a parallel stage from the
+    signal length and the available cores. Bounds always cover every item.
+    """
+
+    def __init__(
+        self,
+        core_count: int,
+        min_chunk_seconds: float = MIN_CHUNK_SECONDS,
+        max_chunk_seconds: float = MAX_CHUNK_SECONDS,
+        chunks_per_worker: int = CHUNKS_PER_WORKER,
+    ):
+        self.core_count = max(int(core_count), 1)
+        self.min_chunk_seconds = min_chunk_seconds
+        self.max_chunk_seconds = max_chunk_seconds
+        self.chunks_per_worker = chunks_per_worker
+        self.envelope = None
+        self.seam_envelope = None
+        self.envelope_rate = 0.0
+        self.quiet_level = 0.0
+
+    @staticmethod
+    def get_envelope(y: np.ndarray, hop: int = ENVELOPE_HOP) -> np.ndarray:
+        """
+        Return the RMS of consecutive HOP-sample frames of Y, in one pass.
+        """
+        n_full = y.shape[0] // hop
+        frames = y[: n_full * hop].reshape(n_full, hop)
+        power = np.einsum("ij,ij->i", frames, frames, dtype=np.float64) / hop
+        if y.shape[0] > n_full * hop:
+            tail = y[n_full * hop :].astype(np.float64)
+            power = np.append(power, np.mean(tail * tail))
+        return np.sqrt(power)
+
+    def set_envelope(self, envelope: np.ndarray, envelope_rate: float):
+        self.envelope = envelope
+        self.envelope_rate = envelope_rate
+        self.seam_envelope = envelope
+        self.quiet_level = 0.0
+        if envelope.size:
+            from scipy.ndimage import maximum_filter1d
+
+            seam_size = 2 * int(SEAM_SECONDS * envelope_rate) + 1
+            self.seam_envelope = maximum_filter1d(envelope, size=seam_size, mode="nearest")
+            self.quiet_level = float(envelope.max()) * 10.0 ** (QUIET_DB / 20.0)
+
+    def shift_envelope(self, seconds: float):
+        offset = int(seconds * self.envelope_rate)
+        if self.envelope is not None:
+            self.envelope = self.envelope[offset:]
+            self.seam_envelope = self.seam_envelope[offset:]
+
+    def get_envelope_index(self, positions, items_per_second: float):
+        index = (np.asarray(positions) / items_per_second * self.envelope_rate).astype(int)
+        return np.clip(index, 0, self.envelope.shape[0] - 1)
+
+    def get_quiet_bound(self, ideal: int, lo: int, hi: int, items_per_second, align: int):
+        candidates = np.arange(-(-lo // align) * align, hi + 1, align)
+        if not candidates.size:
+            return ideal // align * align
+        index = self.get_envelope_index(candidates, items_per_second)
+        levels = self.seam_envelope[index]
+        distance = np.abs(candidates - ideal)
+        # Quietest candidate wins; ties go to the one nearest the ideal split.
+        best = np.lexsort((distance, levels))[0]
+        return int(candidates[best])
+
+    def is_quiet(self, position: int, items_per_second: float, width: int) -> bool:
+        """
+        Return whether the envelope stays below the silence level within
+        WIDTH items either side of POSITION, so a seam there needs no context.
+        """
+        if self.envelope is None or not self.envelope.size:
+            return False
+        lo, hi = self.get_envelope_index([position - width, position + width], items_per_second)
+        return bool(self.envelope[lo : hi + 1].max() <= self.quiet_level)
+
+    def get_chunk_count(self, duration: float) -> int:
+        max_chunks = max(int(duration // self.min_chunk_seconds), 1)
+        workers = min(self.core_count, max_chunks)
+        if workers == 1:
+            chunks = 1
+        else:
+            chunks = workers * self.chunks_per_worker
+        chunks = max(chunks, math.ceil(duration / self.max_chunk_seconds))
+        return min(chunks, max_chunks)
+
+    def get_bounds(self, n_items: int, items_per_second: float, align: int = 1) -> list[int]:
+        n_chunks = self.get_chunk_count(n_items / items_per_second)
+        if self.envelope is not None and self.envelope.size and n_chunks > 1:
+            chunk_items = n_items // n_chunks
+            search = min(int(SPLIT_SEARCH_SECONDS * items_per_second), chunk_items // 4)
+            bounds = [0]
+            for idx in range(1, n_chunks):
+                ideal = n_items * idx // n_chunks
+                bound = self.get_quiet_bound(
+                    ideal, ideal - search, ideal + search, items_per_second, align
+                )
+                bounds.append(bound)
+        else:
+            bounds = [(n_items * idx // n_chunks) // align * align for idx in range(n_chunks)]
+        bounds = sorted({0} | {bound for bound in bounds if bound < n_items}) + [n_items]
+        logging.info(f"ChunkScheduler:get_bounds - {len(bounds) - 1} chunks")
+        return bounds
+
+    def get_ranges(self, n_items: int, items_per_second: float, align: int = 1):
+        bounds = self.get_bounds(n_items, items_per_second, align)
+        return list(zip(bounds[:-1], bounds[1:]))
@@ -0,0 +1,110 @@
+import logging
+import numpy as np
+
+from typing import Optional
+
+from utils.shared_dcs import AudioSpectra
+
+
+# Same framing as librosa.effects.harmonic and librosa.onset.onset_strength,
+# so one STFT serves both.
+N_FFT = 2048
+HOP_LENGTH = 512
+
+
+class SpectralFrontEnd:
+    """
+    Computes each spectral representation of a signal at most once and keeps
+    it on its AudioSpectra, so HPSS, tempo and STFT chroma share one STFT.
+    Only ChromaST shares it across stages, see ChromaMT.
+    """
+
+    def __init__(self, n_fft: int = N_FFT, hop_length: int = HOP_LENGTH):
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+
+    def get_spectra(self, y: np.ndarray, sr: int) -> AudioSpectra:
+        return AudioSpectra(samples=y, sample_rate=sr)
+
+    def get_stft(self, spectra: AudioSpectra) -> np.ndarray:
+        if spectra.stft is None:
+            import librosa
+
+            logging.info("SpectralFrontEnd:get_stft")
+            spectra.stft = librosa.stft(
+                spectra.samples,
+                n_fft=self.n_fft,
+                hop_length=self.hop_length,
+                pad_mode="constant",
+            )
+        return spectra.stft
+
+    def harmonic(self, spectra: AudioSpectra, margin: float = 1.0) -> AudioSpectra:
+        """
+        Same as librosa.effects.harmonic, keeping the harmonic STFT for the
+        stages that follow instead of recomputing it from the output.
+        """
+        import librosa
+
+        logging.info("SpectralFrontEnd:harmonic")
+        y = spectra.samples
+        stft_harm = librosa.decompose.hpss(self.get_stft(spectra), margin=margin)[0]
+        y_harm = librosa.istft(
+            stft_harm,
+            dtype=y.dtype,
+            n_fft=self.n_fft,
+            hop_length=self.hop_length,
+            length=y.shape[-1],
+        )
+        return AudioSpectra(samples=y_harm, sample_rate=spectra.sample_rate, stft=stft_harm)
+
+    def normalize(self, spectra: AudioSpectra) -> AudioSpectra:
+        # Peak normalisation as librosa.util.normalize, applied to the STFT too.
+        y = spectra.samples
+        peak = np.max(np.abs(y)) if y.size else 0.0
+        if peak < np.finfo(y.dtype).tiny:
+            return spectra
+
+        stft = spectra.stft
+        if stft is not None:
+            stft = stft / peak
+        return AudioSpectra(samples=y / peak, sample_rate=spectra.sample_rate, stft=stft)
+
+    def get_onset_envelope(self, spectra: AudioSpectra) -> np.ndarray:
+        if spectra.onset_envelope is None:
+            import librosa
+
+            logging.info("SpectralFrontEnd:get_onset_envelope")
+            sr = spectra.sample_rate
+            power = np.abs(self.get_stft(spectra)) ** 2
+            mel = librosa.feature.melspectrogram(S=power, sr=sr, n_fft=self.n_fft)
+            spectra.onset_envelope = librosa.onset.onset_strength(
+                S=librosa.power_to_db(mel),
+                sr=sr,
+                n_fft=self.n_fft,
+                hop_length=self.hop_length,
+            )
+        return spectra.onset_envelope
+
+    def get_tempo(self, spectra: AudioSpectra) -> float:
+        import librosa
+
+        onset_envelope = self.get_onset_envelope(spectra)
+        tempo = librosa.beat.tempo(
+            onset_envelope=onset_envelope,
+            sr=spectra.sample_rate,
+            hop_length=self.hop_length,
+        )
+        return float(tempo.flatten()[0])
+
+    def get_beat_frames(self, spectra: AudioSpectra, bpm: Optional[float] = None) -> np.ndarray:
+        import librosa
+
+        logging.info("SpectralFrontEnd:get_beat_frames")
+        _, beat_frames = librosa.beat.beat_track(
+            onset_envelope=self.get_onset_envelope(spectra),
+            sr=spectra.sample_rate,
+            hop_length=self.hop_length,
+            bpm=bpm,
+        )
+        return beat_frames
@@ -0,0 +1,130 @@
+import logging
+import numpy as np
+
+from utils.audio_utils.spectral_frontend import N_FFT, HOP_LENGTH
+
+
+# Seconds of onset envelope autocorrelated for each tempogram column, and
+# the tempo prior, as librosa.beat.tempo.
+AC_TIME = 8.0
+START_BPM = 120.0
+STD_BPM = 1.0
+MAX_TEMPO = 320.0
+
+# Seconds of tempogram columns averaged into the current tempo.
+TEMPO_HISTORY_TIME = 20.0
+
+TOP_DB = 80.0
+AMIN = 1e-10
+
+
+class StreamingTempo:
+    """
+    Tempo of a stream of audio blocks as librosa.beat.tempo, at a constant
+    cost per block. Keeps the STFT overlap, the last mel frame and the last
+    AC_TIME of onset envelope between blocks, and a running sum over the
+    tempogram columns of the last HISTORY_TIME seconds.
+    """
+
+    def __init__(
+        self,
+        sr: int,
+        history_time: float = TEMPO_HISTORY_TIME,
+        n_fft: int = N_FFT,
+        hop_length: int = HOP_LENGTH,
+    ):
+        import librosa
+
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.win_length = int(librosa.time_to_frames(AC_TIME, sr=sr, hop_length=hop_length))
+        self.history_frames = max(int(librosa.time_to_frames(history_time, sr=sr, hop_length=hop_length)), 1)
+
+        self.fft_window = librosa.filters.get_window("hann", n_fft, fftbins=True).astype(np.float32)
+        self.mel_basis = librosa.filters.mel(sr=sr, n_fft=n_fft)
+        self.ac_window = librosa.filters.get_window("hann", self.win_length, fftbins=True)
+
+        bpms = librosa.tempo_frequencies(self.win_length, hop_length=hop_length, sr=sr)
+        with np.errstate(divide="ignore"):
+            self.logprior = -0.5 * ((np.log2(bpms) - np.log2(START_BPM)) / STD_BPM) ** 2
+        self.logprior[: int(np.argmax(bpms < MAX_TEMPO))] = -np.inf
+        self.bpms = bpms
+        self.reset()
+
+    def reset(self):
+        self.tail = np.zeros(self.n_fft // 2, dtype=np.float32)
+        self.prev_db = None
+        self.max_db = -np.inf
+        self.onsets = np.zeros(self.win_length - 1)
+
+        self.columns = np.zeros((self.history_frames, self.win_length))
+        self.column_sum = np.zeros(self.win_length)
+        self.column_idx = 0
+        self.n_columns = 0
+
+    def get_onsets(self, y: np.ndarray) -> np.ndarray:
+        """
+        Onset strength of the frames completed by block Y, as
+        librosa.onset.onset_strength with its default mel spectrogram.
+        """
+        samples = np.concatenate((self.tail, y.astype(np.float32, copy=False)))
+        n_frames = 1 + (len(samples) - self.n_fft) // self.hop_length if len(samples) >= self.n_fft else 0
+        if n_frames == 0:
+            self.tail = samples
+            return np.zeros(0)
+
+        self.tail = samples[n_frames * self.hop_length :]
+        frames = np.lib.stride_tricks.sliding_window_view(samples, self.n_fft)[:: self.hop_length][:n_frames]
+        power = np.abs(np.fft.rfft(frames * self.fft_window, axis=1)) ** 2
+        mel_db = 10.0 * np.log10(np.maximum(AMIN, self.mel_basis @ power.T))
+
+        # power_to_db clips TOP_DB below the loudest bin; the stream's so far.
+        self.max_db = max(self.max_db, float(mel_db.max()))
+        np.maximum(mel_db, self.max_db - TOP_DB, out=mel_db)
+
+        if self.prev_db is None:
+            self.prev_db = mel_db[:, :1]
+        flux = np.diff(np.concatenate((self.prev_db, mel_db), axis=1), axis=1)
+        self.prev_db = mel_db[:, -1:]
+        return np.maximum(flux, 0.0).mean(axis=0)
+
+    def add_columns(self, onsets: np.ndarray):
+        """
+        Autocorrelate the window ending at each new onset frame and add the
+        normalised columns to the history, dropping the oldest.
+        """
+        envelope = np.concatenate((self.onsets, onsets))
+        self.onsets = envelope[-(self.win_length - 1) :]
+        windows = np.lib.stride_tricks.sliding_window_view(envelope, self.win_length)[-self.history_frames :]
+
+        spectrum = np.fft.rfft(windows * self.ac_window, n=2 * self.win_length, axis=1)
+        columns = np.fft.irfft(np.abs(spectrum) ** 2, axis=1)[:, : self.win_length]
+        peaks = np.abs(columns).max(axis=1, keepdims=True)
+        np.divide(columns, peaks, out=columns, where=peaks > 0)
+
+        for column in columns:
+            self.column_sum -= self.columns[self.column_idx]
+            self.columns[self.column_idx] = column
+            self.column_sum += column
+            self.column_idx = (self.column_idx + 1) % self.history_frames
+            if self.column_idx == 0:
+                # Resum once per lap so rounding errors can't build up.
+                self.column_sum = self.columns.sum(axis=0)
+        self.n_columns = min(self.n_columns + len(columns), self.history_frames)
+
+    def update(self, y: np.ndarray) -> float:
+        logging.info("StreamingTempo:update")
+        onsets = self.get_onsets(y)
+        if onsets.size:
+            self.add_columns(onsets)
+        return self.get_bpm()
+
+    def get_bpm(self) -> float:
+        if self.n_columns == 0:
+            return 0.0
+        tempogram = self.column_sum / self.n_columns
+        if tempogram.max() <= 0:
+            return START_BPM
+        best_period = np.argmax(np.log1p(1e6 * tempogram) + self.logprior)
+        return float(self.bpms[best_period])
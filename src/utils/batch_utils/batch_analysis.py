@@ -0,0 +1,183 @@
+import sys
+import csv
+import glob
+import json
+import logging
+import hashlib
+import traceback
+import numpy as np
+
+from pathlib import Path
+from dataclasses import asdict
+from typing import Iterable, Optional
+
+from utils.shared_dcs import AudioPipeline, ChromaPipeline, BatchJob, BatchResult
+from utils.audio_utils.audio_ingest import AudioIngest
+from utils.audio_utils.audio_pipeline import ChromaST
+from utils.audio_utils.analysis_pool import AnalysisPool
+from utils.chroma_utils.chroma_filters import ChromaFilter
+from utils.chroma_utils.chroma_processor import ChromaProcessor
+from utils.chroma_utils.chroma_pianoroll import ChromaPianoRoll
+from utils.chroma_utils.chroma_key_tracker import KeyTracker
+from utils.chroma_utils.chroma_beat_sync import BeatSync
+from utils.midi_utils.midi_converter import PianoRollMIDI
+
+
+AUDIO_EXTENSIONS = [".mp3", ".wav", ".ogg", ".flac"]
+RESULT_FIELDS = [
+    "file_path", "key", "probability", "bpm", "chroma_path", "midi_path", "error", "key_segments"
+]
+
+
+def collect_audio_files(inputs: Iterable[str]) -> list[Path]:
+    """
+    Expand files, directories (recursively) and glob patterns into a sorted,
+    de-duplicated list of audio files.
+    """
+    files = []
+    for entry in inputs:
+        path = Path(entry)
+        if path.is_dir():
+            candidates = path.rglob("*")
+        elif path.is_file():
+            candidates = [path]
+        else:
+            candidates = (Path(match) for match in glob.glob(entry, recursive=True))
+
+        for candidate in candidates:
+            if candidate.is_file() and candidate.suffix.lower() in AUDIO_EXTENSIONS:
+                files.append(candidate.resolve())
+    return sorted(set(files))
+
+
+def get_output_path(file_path: str, output_dir: str, suffix: str) -> Path:
+    # Tracks with the same name in different folders must not collide.
+    path_hash = hashlib.sha1(file_path.encode("utf-8")).hexdigest()[:8]
+    return Path(output_dir) / f"{Path(file_path).stem}_{path_hash}{suffix}"
+
+
+def analyze_file(job: BatchJob) -> BatchResult:
+    result = BatchResult(
+        file_path=job.file_path,
+        key="",
+        probability=0.0,
+        bpm=0.0,
+        chroma_path="",
+        midi_path="",
+        error="",
+    )
+    try:
+        audio_buffer = AudioIngest.from_file(job.file_path)
+        audio_decomp = ChromaST(job.adpl).get_audio_decomp(audio_buffer)
+        frames_per_column = BeatSync.get_frames_per_column(audio_decomp)
+        chroma_filter = ChromaFilter(audio_decomp.chromas, copy=False, frames_per_column=frames_per_column)
+        chromas = chroma_filter.apply_pipeline(job.chpl).get()
+
+        result.key, result.probability = ChromaProcessor.get_key_probability(chromas)
+        result.bpm = float(audio_decomp.bpm)
+
+        if job.key_track:
+            column_times = BeatSync.get_column_times(audio_decomp)
+            result.key_segments = KeyTracker().track(chromas, column_times)
+
+        if job.chroma_dir:
+            chroma_path = get_output_path(job.file_path, job.chroma_dir, ".npy")
+            np.save(chroma_path, chromas)
+            result.chroma_path = str(chroma_path)
+
+        if job.midi_dir and audio_decomp.bpm:
+            midi_path = get_output_path(job.file_path, job.midi_dir, ".mid")
+            sr = int(audio_decomp.sample_rate)
+            column_times = audio_decomp.column_times
+            piano_roll = ChromaPianoRoll(chromas, sr, column_times).get_piano_roll()
+            midi_file = PianoRollMIDI(piano_roll, audio_decomp.bpm).get_midi_file()
+            with open(midi_path, "wb") as f:
+                midi_file.writeFile(f)
+            result.midi_path = str(midi_path)
+
+    except Exception as error:
+        error_tb = "".join(traceback.format_tb(error.__traceback__))
+        logging.error(f"ERROR AT analyze_file {job.file_path}:\n{error_tb}")
+        result.error = f"{type(error).__name__}: {error}"
+    return result
+
+
+class BatchWriter:
+    """
+    Writes BatchResults as JSON lines or CSV, one row per analysed file.
+    """
+
+    def __init__(self, output_path: Optional[str], output_format: str):
+        self.output_path = output_path
+        self.output_format = output_format
+        self.file = None
+        self.csv_writer = None
+
+    def __enter__(self):
+        if self.output_path:
+            self.file = open(self.output_path, "w", newline="", encoding="utf-8")
+        else:
+            self.file = sys.stdout
+        if self.output_format == "csv":
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=RESULT_FIELDS)
+            self.csv_writer.writeheader()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.output_path:
+            self.file.close()
+
+    def write(self, result: BatchResult):
+        row = asdict(result)
+        if self.csv_writer is not None:
+            row["key_segments"] = json.dumps(row["key_segments"])
+            self.csv_writer.writerow(row)
+        else:
+            self.file.write(json.dumps(row) + "\n")
+        self.file.flush()
+
+
+class BatchAnalyzer:
+    def __init__(self, adpl: AudioPipeline, chpl: ChromaPipeline, workers: int):
+        self.adpl = adpl
+        self.chpl = chpl
+        self.workers = max(int(workers), 1)
+
+    def get_jobs(
+        self, files: list[Path], chroma_dir=None, midi_dir=None, key_track=False
+    ) -> list[BatchJob]:
+        for output_dir in (chroma_dir, midi_dir):
+            if output_dir:
+                Path(output_dir).mkdir(parents=True, exist_ok=True)
+        jobs = []
+        for file_path in files:
+            job = BatchJob(
+                file_path=str(file_path),
+                adpl=self.adpl,
+                chpl=self.chpl,
+                chroma_dir=chroma_dir,
+                midi_dir=midi_dir,
+                key_track=key_track,
+            )
+            jobs.append(job)
+        return jobs
+
+    def run(self, jobs: list[BatchJob], writer: BatchWriter) -> int:
+        """
+        Analyse JOBS across the pool, writing each result as soon as it is
+        ready. Returns the number of files that failed.
+        """
+        logging.info(f"BatchAnalyzer:run - {len(jobs)} files, {self.workers} workers")
+        failed = 0
+        if self.workers == 1:
+            results = map(analyze_file, jobs)
+        else:
+            pool = AnalysisPool.get_pool(self.workers)
+            results = pool.imap_unordered(analyze_file, jobs, chunksize=1)
+
+        for idx, result in enumerate(results):
+            writer.write(result)
+            if result.error:
+                failed += 1
+            logging.info(f"BatchAnalyzer:run - {idx + 1}/{len(jobs)} {result.file_path}")
+        return failed
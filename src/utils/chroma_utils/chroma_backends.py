@@ -0,0 +1,88 @@
+import logging
+import numpy as np
+
+from typing import Optional
+
+from utils.shared_dcs import AudioSpectra
+from utils.audio_utils.chunk_scheduler import ChunkScheduler
+from utils.audio_utils.spectral_frontend import SpectralFrontEnd
+from utils.chroma_utils.chroma_cqt import (
+    ParallelChromaCQT,
+    chroma_cqt,
+    BINS_PER_OCTAVE,
+    CHROMA_THRESHOLD,
+    HOP_LENGTH,
+    N_CHROMA,
+)
+
+
+# Chroma backends selectable through AudioPipeline.chroma_backend.
+#
+#   backend       resolution              speedup   keys correct
+#   cqt           CQT, 36 bins/octave     1.0x      24/24
+#   cqt_reduced   CQT, 12 bins/octave     1.6x      24/24
+#   stft          STFT, 2048-point        3.4x      16/24
+#
+# Speedup is chroma time (tuning estimation included) against "cqt" on a
+# 60 s track, single core. Keys are for synthetic chord progressions with
+# percussion and noise in all 24 major/minor keys, through the full
+# pipeline with the default filters. The STFT backend's misses are closely
+# related keys (relative, dominant), so keep "cqt" wherever the key matters.
+CQT_BINS_PER_OCTAVE = {
+    "cqt": BINS_PER_OCTAVE,
+    "cqt_reduced": 12,
+}
+# Each chroma sums a third as many bins at 12 bins/octave, so the silence
+# threshold scales with the resolution.
+CQT_THRESHOLDS = {
+    "cqt": CHROMA_THRESHOLD,
+    "cqt_reduced": CHROMA_THRESHOLD * 12 / BINS_PER_OCTAVE,
+}
+CHROMA_BACKENDS = ["cqt", "cqt_reduced", "stft"]
+
+
+def chroma_stft(spectra: AudioSpectra, frontend: SpectralFrontEnd, tuning=None) -> np.ndarray:
+    """
+    Chroma from the front end's STFT, which HPSS and tempo already share.
+    TUNING is in fractions of a BINS_PER_OCTAVE bin, as for chroma_cqt.
+    """
+    import librosa
+
+    magnitude = np.abs(frontend.get_stft(spectra))
+    if tuning is None:
+        tuning = librosa.estimate_tuning(
+            S=magnitude**2, sr=spectra.sample_rate, bins_per_octave=BINS_PER_OCTAVE
+        )
+    return librosa.feature.chroma_stft(
+        S=magnitude**2,
+        sr=spectra.sample_rate,
+        n_fft=frontend.n_fft,
+        hop_length=HOP_LENGTH,
+        n_chroma=N_CHROMA,
+        tuning=float(tuning) * N_CHROMA / BINS_PER_OCTAVE,
+    )
+
+
+def compute_chromas(
+    spectra: AudioSpectra,
+    frontend: SpectralFrontEnd,
+    backend: str,
+    tuning=None,
+    scheduler: Optional[ChunkScheduler] = None,
+) -> np.ndarray:
+    """
+    Compute chromas with BACKEND. CQT backends run across the pool when a
+    SCHEDULER is given.
+    """
+    logging.info(f"compute_chromas - {backend}")
+    if backend == "stft":
+        return chroma_stft(spectra, frontend, tuning)
+    if backend not in CQT_BINS_PER_OCTAVE:
+        raise ValueError(f"Unknown chroma backend: {backend}")
+
+    y, sr = spectra.samples, spectra.sample_rate
+    bins_per_octave = CQT_BINS_PER_OCTAVE[backend]
+    threshold = CQT_THRESHOLDS[backend]
+    if scheduler is not None:
+        return ParallelChromaCQT(scheduler, bins_per_octave, threshold).compute(y, sr, tuning)
+    return chroma_cqt(y, sr, tuning, threshold, bins_per_octave)
@@ -0,0 +1,80 @@
+import logging
+import numpy as np
+
+from utils.shared_dcs import AudioDecomp
+from utils.chroma_utils.chroma_cqt import HOP_LENGTH
+
+
+class BeatSync:
+    """
+    Aggregates chroma frames between consecutive beats, or evenly spaced
+    sub-beats, so later stages work on one column per grid step.
+    """
+
+    def __init__(self, subdivisions: int = 1):
+        self.subdivisions = max(int(subdivisions), 1)
+
+    def get_grid_frames(self, beat_frames: np.ndarray) -> np.ndarray:
+        beat_frames = np.asarray(beat_frames, dtype=np.float64)
+        if self.subdivisions == 1 or beat_frames.size < 2:
+            return beat_frames.astype(int)
+
+        steps = np.arange(self.subdivisions) / self.subdivisions
+        beat_lengths = np.diff(beat_frames)
+        grid = beat_frames[:-1, np.newaxis] + beat_lengths[:, np.newaxis] * steps
+        grid = np.append(grid.ravel(), beat_frames[-1])
+        return np.unique(np.round(grid).astype(int))
+
+    def sync(
+        self, chromas: np.ndarray, beat_frames: np.ndarray, sr: int, hop_length: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the median of each grid step and the columns' boundary times.
+        The first column covers any frames before the first beat and the last
+        runs to the end, so the columns are not evenly spaced.
+        """
+        import librosa
+
+        logging.info("BeatSync:sync")
+        n_frames = chromas.shape[1]
+        grid_frames = self.get_grid_frames(beat_frames)
+        if grid_frames.size == 0:
+            return chromas, get_frame_times(n_frames, sr, hop_length)
+
+        # The same boundaries librosa.util.sync pads the grid to.
+        bounds = librosa.util.fix_frames(grid_frames, x_min=0, x_max=n_frames)
+        synced = librosa.util.sync(chromas, grid_frames, aggregate=np.median)
+        return synced, librosa.frames_to_time(bounds, sr=sr, hop_length=hop_length)
+
+    @staticmethod
+    def get_column_times(audio_decomp: AudioDecomp) -> np.ndarray:
+        """
+        Boundary times in seconds of the chroma columns, beat-synchronous or not.
+        """
+        if audio_decomp.column_times is not None:
+            column_times = audio_decomp.column_times.copy()
+        else:
+            column_times = get_frame_times(audio_decomp.chromas.shape[1], audio_decomp.sample_rate, HOP_LENGTH)
+        # The last frame starts within the audio, but its end can run past it.
+        if len(column_times) > 1:
+            duration = len(audio_decomp.audio_array) / audio_decomp.sample_rate
+            column_times[-1] = max(min(column_times[-1], duration), column_times[-2])
+        return column_times
+
+    @staticmethod
+    def get_frames_per_column(audio_decomp: AudioDecomp) -> float:
+        """
+        Mean number of STFT frames aggregated into each chroma column, 1.0
+        unless the chroma is beat-synchronous.
+        """
+        if audio_decomp.column_times is None:
+            return 1.0
+        column_times = BeatSync.get_column_times(audio_decomp)
+        if len(column_times) < 2:
+            return 1.0
+        frame_time = HOP_LENGTH / audio_decomp.sample_rate
+        return max(float(np.mean(np.diff(column_times))) / frame_time, 1.0)
+
+
+def get_frame_times(n_frames: int, sr: float, hop_length: int) -> np.ndarray:
+    return np.arange(n_frames + 1) * hop_length / sr
@@ -0,0 +1,143 @@
+import logging
+import numpy as np
+
+from functools import lru_cache
+
+
+N_OCTAVES = 7
+SPARSITY = 0.01
+# As librosa>=0.10 chroma_cqt, which also provides the wavelet filters used here.
+RES_TYPE = "soxr_hq"
+
+# Engines differ by sample rate, resolution and tuning. Each is about 64 KB,
+# so the cache holds every 0.01 bin tuning step at one rate.
+CHROMA_ENGINE_CACHE_SIZE = 128
+
+
+class ChromaEngine:
+    """
+    Constant-Q chromagram equivalent to librosa.feature.chroma_cqt, with the
+    per-octave CQT kernels and the chroma mapping built once. Each call only
+    pays for the STFTs, the kernel products and the octave resampling.
+    """
+
+    def __init__(
+        self,
+        sr: int,
+        hop_length: int,
+        bins_per_octave: int,
+        n_chroma: int,
+        tuning: float,
+        n_octaves: int = N_OCTAVES,
+    ):
+        import librosa
+
+        logging.info(f"ChromaEngine:__init__ - {sr} Hz, tuning {tuning}")
+        self.sr = sr
+        self.hop_length = hop_length
+        self.n_bins = n_octaves * bins_per_octave
+
+        fmin = librosa.note_to_hz("C1") * 2.0 ** (tuning / bins_per_octave)
+        freqs = librosa.cqt_frequencies(self.n_bins, fmin=fmin, bins_per_octave=bins_per_octave)
+        relative_bw = 2.0 ** (2.0 / bins_per_octave)
+        alpha = np.full(self.n_bins, (relative_bw - 1) / (relative_bw + 1))
+
+        _, filter_cutoff = librosa.filters.wavelet_lengths(
+            freqs=freqs, sr=sr, window="hann", filter_scale=1, gamma=0, alpha=alpha
+        )
+        self.downsample_factor = self.get_downsample_factor(sr / 2.0, filter_cutoff, n_octaves)
+        base_sr = sr / self.downsample_factor
+        base_hop = hop_length // self.downsample_factor
+
+        # V /= sqrt(lengths) commutes with abs(), so it is folded into the kernels.
+        lengths, _ = librosa.filters.wavelet_lengths(
+            freqs=freqs, sr=base_sr, window="hann", filter_scale=1, gamma=0, alpha=alpha
+        )
+
+        self.octaves = []
+        oct_sr, oct_hop = base_sr, base_hop
+        for idx in range(n_octaves):
+            stop = self.n_bins - idx * bins_per_octave
+            sl = slice(stop - bins_per_octave, stop)
+            fft_basis, n_fft = self.get_fft_basis(librosa, freqs[sl], alpha[sl], oct_sr)
+            scale = np.sqrt(base_sr / oct_sr) / np.sqrt(lengths[sl])
+            fft_basis = fft_basis.multiply(scale[:, np.newaxis]).tocsr().astype(np.complex64)
+
+            downsample = oct_hop % 2 == 0
+            self.octaves.append((sl, fft_basis, n_fft, oct_hop, downsample))
+            if downsample:
+                oct_hop //= 2
+                oct_sr /= 2.0
+
+        self.chroma_map = librosa.filters.cq_to_chroma(
+            self.n_bins, bins_per_octave=bins_per_octave, n_chroma=n_chroma
+        ).astype(np.float32)
+
+    def get_downsample_factor(self, nyquist: float, filter_cutoff: float, n_octaves: int) -> int:
+        count_cutoff = max(0, int(np.ceil(np.log2(nyquist / filter_cutoff)) - 1) - 1)
+        hop, num_twos = self.hop_length, 0
+        while hop > 0 and hop % 2 == 0:
+            hop //= 2
+            num_twos += 1
+        count_hop = max(0, num_twos - n_octaves + 1)
+        return 2 ** min(count_cutoff, count_hop)
+
+    @staticmethod
+    def get_fft_basis(librosa, freqs: np.ndarray, alpha: np.ndarray, sr: float):
+        basis, lengths = librosa.filters.wavelet(
+            freqs=freqs,
+            sr=sr,
+            filter_scale=1,
+            norm=1,
+            pad_fft=True,
+            window="hann",
+            gamma=0,
+            alpha=alpha,
+        )
+        n_fft = basis.shape[1]
+        basis *= lengths[:, np.newaxis] / float(n_fft)
+        fft_basis = np.fft.fft(basis, n=n_fft, axis=1)[:, : (n_fft // 2) + 1]
+        fft_basis = librosa.util.sparsify_rows(fft_basis, quantile=SPARSITY, dtype=np.complex64)
+        return fft_basis, n_fft
+
+    def get_cqt_magnitude(self, y: np.ndarray) -> np.ndarray:
+        import librosa
+
+        if self.downsample_factor > 1:
+            y = librosa.resample(
+                y, orig_sr=self.downsample_factor, target_sr=1, res_type=RES_TYPE, scale=True
+            )
+
+        responses = []
+        for sl, fft_basis, n_fft, hop, downsample in self.octaves:
+            stft = librosa.stft(
+                y,
+                n_fft=n_fft,
+                hop_length=hop,
+                window="ones",
+                pad_mode="constant",
+                dtype=np.complex64,
+            )
+            responses.append((sl, np.abs(fft_basis.dot(stft))))
+            if downsample:
+                y = librosa.resample(y, orig_sr=2, target_sr=1, res_type=RES_TYPE, scale=True)
+
+        n_frames = min(response.shape[1] for _, response in responses)
+        magnitude = np.empty((self.n_bins, n_frames), dtype=np.float32)
+        for sl, response in responses:
+            magnitude[sl] = response[:, :n_frames]
+        return magnitude
+
+    def compute(self, y: np.ndarray, threshold: float = 0.0) -> np.ndarray:
+        import librosa
+
+        chroma = self.chroma_map @ self.get_cqt_magnitude(y)
+        chroma[chroma < threshold] = 0.0
+        return librosa.util.normalize(chroma, norm=np.inf, axis=-2)
+
+
+@lru_cache(maxsize=CHROMA_ENGINE_CACHE_SIZE)
+def get_chroma_engine(
+    sr: int, hop_length: int, bins_per_octave: int, n_chroma: int, tuning: float
+) -> ChromaEngine:
+    return ChromaEngine(sr, hop_length, bins_per_octave, n_chroma, tuning)
@@ -1,34 +1,179 @@
+import logging
+import threading
 import numpy as np
 
-from scipy.ndimage import median_filter
-from librosa.decompose import nn_filter
 from typing import Callable
+from collections import OrderedDict
+
+from utils.shared_dcs import ChromaPipeline
+
+
+# Frames searched each side for nearest neighbours, about 3 minutes at hop
+# 512. On tracks up to twice that the output is close to librosa's
+# nn_filter, which compares every pair of frames, but near-ties between
+# neighbour distances can be broken differently.
+NN_BAND = 8192
+NN_BLOCK_SIZE = 256
+
+# Intermediate results kept by ChromaFilterCache, one chromagram each.
+FILTER_CACHE_SIZE = 16
+
+
+def get_nn_distances(block: np.ndarray, window: np.ndarray, metric: str) -> np.ndarray:
+    if metric == "cosine":
+        return 1.0 - block @ window.T
+    if metric == "euclidean":
+        squared = (block**2).sum(axis=1)[:, np.newaxis] + (window**2).sum(axis=1) - 2 * block @ window.T
+        return np.sqrt(np.maximum(squared, 0.0))
+    raise ValueError(f"Unsupported nn_filter metric: {metric}")
+
+
+def banded_nn_filter(
+    S: np.ndarray,
+    aggregate: Callable = np.median,
+    metric: str = "cosine",
+    band: int = NN_BAND,
+    block_size: int = NN_BLOCK_SIZE,
+) -> np.ndarray:
+    """
+    Nearest-neighbour filter as librosa.decompose.nn_filter, with neighbours
+    searched only within BAND frames of each frame. Time and memory grow
+    linearly with the number of frames. Frames whose neighbours are near-tied
+    can differ from librosa's.
+    """
+    frames = S.T.astype(np.float32)
+    n_frames = frames.shape[0]
+    # librosa's neighbour count, over the frames one band can reach.
+    n_window = min(n_frames, 2 * band + 1)
+    k = min(int(2 * np.ceil(np.sqrt(n_window - 1))), n_window - 1)
+    n_nearest = min(k + 2, n_window - 1)
+
+    if metric == "cosine":
+        norms = np.linalg.norm(frames, axis=1, keepdims=True)
+        frames = np.divide(frames, norms, out=np.zeros_like(frames), where=norms > 0)
+
+    S_out = np.empty_like(S.T)
+    for start in range(0, n_frames, block_size):
+        end = min(start + block_size, n_frames)
+        w_start, w_end = max(start - band, 0), min(end + band, n_frames)
+        distances = get_nn_distances(frames[start:end], frames[w_start:w_end], metric)
+
+        # Mask frames outside each row's band, and the frame itself.
+        offsets = np.subtract.outer(np.arange(start, end), np.arange(w_start, w_end))
+        distances[(np.abs(offsets) > band) | (offsets == 0)] = np.inf
+
+        # Like librosa, keep the k earliest of the k + 2 nearest frames.
+        nearest = np.argpartition(distances, n_nearest - 1, axis=1)[:, :n_nearest]
+        neighbours = np.sort(nearest, axis=1)[:, :k] + w_start
+        S_out[start:end] = aggregate(S.T[neighbours], axis=1)
+    return S_out.T
 
 
 class ChromaFilter:
-    def __init__(self, chromas: np.ndarray):
-        self.chromas = chromas
+    """
+    Filter chain over a single working copy of a chromagram. Each stage runs
+    in place; median smoothing ping-pongs with one scratch buffer. Widths
+    are given in STFT frames and divided by FRAMES_PER_COLUMN, so they span
+    the same time on beat-synchronous chroma.
+    """
+
+    def __init__(self, chromas: np.ndarray, copy: bool = True, frames_per_column: float = 1.0):
+        self.chromas = np.array(chromas) if copy else np.asarray(chromas)
+        self.frames_per_column = frames_per_column
+        self.scratch = None
 
     def abs_filter(self):
-        self.chromas = np.abs(self.chromas) ** 2
+        np.abs(self.chromas, out=self.chromas)
+        np.square(self.chromas, out=self.chromas)
         return self
 
-    def nn_filter(self, aggregate: Callable = np.median, metric: str = "cosine"):
-        nnf_chromas = nn_filter(self.chromas, aggregate=aggregate, metric=metric)
-        self.chromas = np.minimum(self.chromas, nnf_chromas)
+    def nn_filter(self, band: int = NN_BAND, aggregate: Callable = np.median, metric: str = "cosine"):
+        nnf_chromas = banded_nn_filter(self.chromas, aggregate, metric, band)
+        np.minimum(self.chromas, nnf_chromas, out=self.chromas)
         return self
 
     def smoothing_filter(self, strength: float):
-        strength = int(strength)
-        self.chromas = median_filter(self.chromas, size=(1, strength))
+        from scipy.ndimage import median_filter
+
+        if self.scratch is None:
+            self.scratch = np.empty_like(self.chromas)
+        median_filter(self.chromas, size=(1, int(strength)), output=self.scratch)
+        self.chromas, self.scratch = self.scratch, self.chromas
         return self
 
     def clip_filter(self, clip_value: float):
-        for chroma_idx in range(len(self.chromas)):
-            for idx, chroma_value in enumerate(self.chromas[chroma_idx]):
-                if chroma_value < clip_value:
-                    self.chromas[chroma_idx][idx] = 0.0
+        self.chromas[self.chromas < clip_value] = 0.0
+        return self
+
+    @staticmethod
+    def get_stages(chpl: ChromaPipeline, frames_per_column: float = 1.0) -> list[tuple[str, tuple]]:
+        """
+        Return the enabled stages of CHPL in order, as method names and
+        their arguments in columns.
+        """
+        stages = []
+        if chpl.abs_fl_state:
+            stages.append(("abs_filter", ()))
+        if chpl.nn_fl_state:
+            band = max(int(NN_BAND / frames_per_column), 1)
+            stages.append(("nn_filter", (band,)))
+        if chpl.mds_fl_state:
+            width = max(int(chpl.mds_val / frames_per_column), 1)
+            stages.append(("smoothing_filter", (width,)))
+        if chpl.min_clip_fl_state:
+            stages.append(("clip_filter", (chpl.min_clip_val,)))
+        return stages
+
+    def apply_stages(self, stages: list[tuple[str, tuple]]):
+        for name, args in stages:
+            logging.info(f"ChromaFilter:{name}")
+            getattr(self, name)(*args)
         return self
 
+    def apply_pipeline(self, chpl: ChromaPipeline):
+        return self.apply_stages(self.get_stages(chpl, self.frames_per_column))
+
     def get(self):
         return self.chromas
+
+
+class ChromaFilterCache:
+    """
+    Memoises the output of every prefix of a filter chain over one chromagram,
+    keyed by the stages up to that point, so changing a stage only reruns the
+    stages from it onwards. Cached arrays are read-only.
+    """
+
+    def __init__(self, chromas: np.ndarray, frames_per_column: float = 1.0, max_size: int = FILTER_CACHE_SIZE):
+        self.chromas = chromas
+        self.frames_per_column = frames_per_column
+        self.max_size = max_size
+        self.cache: OrderedDict[tuple, np.ndarray] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_cached_prefix(self, stages: list) -> tuple[int, np.ndarray]:
+        for n_stages in range(len(stages), 0, -1):
+            prefix = tuple(stages[:n_stages])
+            if prefix in self.cache:
+                self.cache.move_to_end(prefix)
+                return n_stages, self.cache[prefix]
+        return 0, self.chromas
+
+    def put(self, prefix: tuple, chromas: np.ndarray):
+        chromas.flags.writeable = False
+        self.cache[prefix] = chromas
+        self.cache.move_to_end(prefix)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    def apply_pipeline(self, chpl: ChromaPipeline) -> np.ndarray:
+        stages = ChromaFilter.get_stages(chpl, self.frames_per_column)
+        with self.lock:
+            n_cached, chromas = self.get_cached_prefix(stages)
+            logging.info(f"ChromaFilterCache:apply_pipeline - {n_cached}/{len(stages)} cached")
+
+            for n_stages in range(n_cached, len(stages)):
+                chroma_filter = ChromaFilter(chromas).apply_stages([stages[n_stages]])
+                chromas = chroma_filter.get()
+                self.put(tuple(stages[: n_stages + 1]), chromas)
+            return chromas
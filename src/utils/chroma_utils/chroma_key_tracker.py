@@ -0,0 +1,199 @@
+import logging
+import numpy as np
+
+from typing import Optional
+
+from utils.shared_dcs import KeySegment
+from utils.keyidentifier import classifiers
+from utils.keyidentifier import pitchdistribution as pd
+
+
+# Each window's pitch distribution covers WINDOW_TIME seconds, and windows
+# start STEP_TIME seconds apart.
+WINDOW_TIME = 8.0
+STEP_TIME = 2.0
+
+# NaiveBayes temperature for these windows, fitted as in classifiers on 8 s
+# windows of synthetic progressions in all 24 keys.
+KEY_TRACKING_TEMPERATURE = 0.007
+
+# Chance of a key change between consecutive windows for the smoothed path.
+SWITCH_PROBABILITY = 0.003
+
+
+class KeyTracker:
+    """
+    Key timeline of a chromagram. Pitch distributions of all sliding windows
+    come from one cumulative sum over the frames and are scored in one
+    classifier call, so time and memory grow linearly with the input.
+    """
+
+    def __init__(
+        self,
+        window_time: float = WINDOW_TIME,
+        step_time: float = STEP_TIME,
+        smoothing: bool = True,
+        switch_probability: float = SWITCH_PROBABILITY,
+        classifier: Optional[classifiers.Classifier] = None,
+    ):
+        self.window_time = window_time
+        self.step_time = step_time
+        self.smoothing = smoothing
+        self.switch_probability = switch_probability
+        if classifier is None:
+            classifier = classifiers.NaiveBayes(temperature=KEY_TRACKING_TEMPERATURE)
+        self.classifier = classifier
+
+    def get_windows(self, column_times: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Column ranges [start, end) of the windows, given the columns' boundary
+        times. A column belongs to the windows its start time falls in, so
+        uneven beat-synchronous columns are placed where they were played.
+        """
+        column_starts = column_times[:-1]
+        duration = column_times[-1] - column_times[0]
+        offsets = np.arange(0.0, max(duration - self.window_time, 0.0) + 1e-9, self.step_time)
+        window_starts = column_times[0] + offsets
+        starts = np.searchsorted(column_starts, window_starts, side="left")
+        ends = np.searchsorted(column_starts, window_starts + self.window_time, side="left")
+        return starts, ends
+
+    @staticmethod
+    def get_distributions(
+        chromas: np.ndarray, starts: np.ndarray, ends: np.ndarray, weighted: bool = False
+    ) -> np.ndarray:
+        """
+        Return the (N, 12) pitch distributions of frames [start, end) in NOTES
+        order, as PitchDistribution.from_chromagram. Silent frames are left out.
+        """
+        n_frames = chromas.shape[1]
+        voiced = chromas.max(axis=0) > 0 if n_frames else np.zeros(0, dtype=bool)
+        if weighted:
+            values = chromas.T.astype(np.float64)
+        else:
+            values = np.zeros((n_frames, pd.NUM_NOTES), dtype=np.int32)
+            values[np.arange(n_frames), chromas.argmax(axis=0)] = 1
+        values[~voiced] = 0
+
+        cumulative = np.zeros((n_frames + 1, pd.NUM_NOTES), dtype=values.dtype)
+        np.cumsum(values, axis=0, out=cumulative[1:])
+        dists = (cumulative[ends] - cumulative[starts]).astype(np.float64)
+        totals = dists.sum(axis=1, keepdims=True)
+        np.divide(dists, totals, out=dists, where=totals > 0)
+        return np.roll(dists, pd.CHROMAGRAM_OFFSET, axis=1)
+
+    def get_probabilities(self, dists: np.ndarray) -> np.ndarray:
+        probabilities = self.classifier.get_probabilities(dists)
+        # Windows of silence carry no evidence for any key.
+        probabilities[dists.sum(axis=1) == 0] = 1.0 / len(classifiers.KEYS)
+        return probabilities
+
+    def viterbi(self, probabilities: np.ndarray) -> np.ndarray:
+        """
+        Most likely key path through the windows' posteriors, with every key
+        change equally likely. Keeping the key or jumping from the best
+        previous key are the only candidates, so each step is O(24).
+        """
+        n_keys = probabilities.shape[1]
+        log_probs = np.log(np.maximum(probabilities, np.finfo(np.float64).tiny))
+        log_stay = np.log1p(-self.switch_probability)
+        log_switch = np.log(self.switch_probability / (n_keys - 1))
+
+        key_idxs = np.arange(n_keys)
+        backpointers = np.empty(probabilities.shape, dtype=np.intp)
+        delta = log_probs[0].copy()
+        for idx in range(1, len(log_probs)):
+            best = int(delta.argmax())
+            stay = delta + log_stay
+            switch = delta[best] + log_switch
+            stays = stay >= switch
+            backpointers[idx] = np.where(stays, key_idxs, best)
+            delta = np.where(stays, stay, switch) + log_probs[idx]
+
+        path = np.empty(len(log_probs), dtype=np.intp)
+        path[-1] = int(delta.argmax())
+        for idx in range(len(log_probs) - 1, 0, -1):
+            path[idx - 1] = backpointers[idx, path[idx]]
+        return path
+
+    def get_segments(
+        self, path: np.ndarray, probabilities: np.ndarray, centres: np.ndarray, duration: float
+    ) -> list[KeySegment]:
+        # Consecutive windows in the same key form one segment, split halfway
+        # between the centres of the windows either side of a change.
+        changes = np.flatnonzero(np.diff(path)) + 1
+        bounds = np.concatenate(([0], changes, [len(path)]))
+        times = np.concatenate(([0.0], (centres[changes - 1] + centres[changes]) / 2, [duration]))
+        confidences = probabilities[np.arange(len(path)), path]
+
+        segments = []
+        for idx in range(len(bounds) - 1):
+            first, last = bounds[idx], bounds[idx + 1]
+            segment = KeySegment(
+                start=round(float(times[idx]), 3),
+                end=round(float(times[idx + 1]), 3),
+                key=classifiers.KEYS[path[first]],
+                confidence=round(float(confidences[first:last].mean()) * 100, 2),
+            )
+            segments.append(segment)
+        return segments
+
+    def track(self, chromas: np.ndarray, column_times: np.ndarray, weighted: bool = False) -> list[KeySegment]:
+        """
+        Return the key segments of CHROMAS, whose columns have boundary times
+        COLUMN_TIMES. Confidence is the key's mean posterior, as a percentage.
+        """
+        n_frames = chromas.shape[1]
+        if n_frames == 0:
+            return []
+
+        logging.info(f"KeyTracker:track - {n_frames} frames")
+        starts, ends = self.get_windows(column_times)
+        dists = self.get_distributions(chromas, starts, ends, weighted)
+        probabilities = self.get_probabilities(dists)
+        if self.smoothing:
+            path = self.viterbi(probabilities)
+        else:
+            path = probabilities.argmax(axis=1)
+
+        centres = (column_times[starts] + column_times[ends]) / 2
+        return self.get_segments(path, probabilities, centres, column_times[-1])
+
+
+class KeyAccumulator:
+    """
+    Running pitch-class counts of a chromagram that grows chunk by chunk, so
+    the current key costs only the new frames. With a HALF_LIFE in seconds,
+    older frames fade out exponentially instead of being kept until reset.
+    """
+
+    def __init__(self, half_life: Optional[float] = None):
+        self.half_life = half_life
+        self.counts = np.zeros(pd.NUM_NOTES, dtype=np.float64)
+
+    def reset(self):
+        self.counts[:] = 0.0
+
+    def update(self, chromas: np.ndarray, column_times: np.ndarray):
+        # Counted as PitchDistribution.from_chromagram: each frame adds one
+        # to its most prominent note, decayed by the time since it ended.
+        n_frames = chromas.shape[1]
+        if n_frames == 0:
+            return
+        notes = chromas.argmax(axis=0)
+        if self.half_life is None:
+            self.counts += np.bincount(notes, minlength=pd.NUM_NOTES)
+            return
+
+        end_time = column_times[-1]
+        weights = 0.5 ** ((end_time - column_times[1:]) / self.half_life)
+        self.counts *= 0.5 ** ((end_time - column_times[0]) / self.half_life)
+        self.counts += np.bincount(notes, weights=weights, minlength=pd.NUM_NOTES)
+
+    def get_distribution(self) -> np.ndarray:
+        """
+        Return the accumulated distribution in NOTES order
+        """
+        total = self.counts.sum()
+        dist = self.counts / total if total > 0 else self.counts.copy()
+        return np.roll(dist, pd.CHROMAGRAM_OFFSET)
@@ -1,18 +1,21 @@
-import librosa
-
 import numpy as np
+from typing import Optional
 from utils.shared_dcs import MIDINote, OnsetMIDINote
 
 
 class ChromaPRBase:
-    def __init__(self, chromas: np.ndarray, sample_rate: int):
+    def __init__(self, chromas: np.ndarray, sample_rate: int, column_times: Optional[np.ndarray] = None):
         self._chromas = chromas
         self._sample_rate = sample_rate
         self._hop_length = 512
+        self._column_times = column_times
         self._note_offset = 48
 
-    def _get_hop_time(self) -> float:
-        return self._hop_length / self._sample_rate
+    def _get_column_times(self) -> np.ndarray:
+        # Beat-synchronous chromas have uneven columns, given by their boundaries.
+        if self._column_times is not None:
+            return self._column_times
+        return np.arange(self._get_len_chroma_duration() + 1) * self._hop_length / self._sample_rate
 
     def _get_len_chroma_duration(self) -> int:
         return len(self._chromas[0])
@@ -22,17 +25,19 @@ class ChromaPRBase:
 
 
 class ChromaPianoRoll(ChromaPRBase):
-    def __init__(self, chromas: np.ndarray, sample_rate: int):
-        super().__init__(chromas, sample_rate)
+    def __init__(self, chromas: np.ndarray, sample_rate: int, column_times: Optional[np.ndarray] = None):
+        super().__init__(chromas, sample_rate, column_times)
 
     def get_piano_roll(self) -> list[MIDINote]:
+        import librosa
+
         piano_roll: list[MIDINote] = []
         note_dict: dict[int, OnsetMIDINote] = {}
         expired_notes = []
 
         len_chromas = self._get_len_chromas()
         len_chroma_duration = self._get_len_chroma_duration()
-        hop_time = self._get_hop_time()
+        column_times = self._get_column_times()
 
         for chroma_pos in range(len_chroma_duration):
             note_values = []
@@ -44,7 +49,7 @@ class ChromaPianoRoll(ChromaPRBase):
             for note_value in note_values:
                 if note_value not in note_dict:
                     note_name = str(librosa.midi_to_note(note_value))
-                    note_onset = chroma_pos * hop_time
+                    note_onset = column_times[chroma_pos]
                     onset_midi = OnsetMIDINote(
                         note_value=note_value,
                         note_name=note_name,
@@ -57,7 +62,7 @@ class ChromaPianoRoll(ChromaPRBase):
                     note_value = note + self._note_offset
                     note_name = str(librosa.midi_to_note(note_value))
                     note_onset = onset_midi.onset
-                    note_offset = chroma_pos * hop_time
+                    note_offset = column_times[chroma_pos]
                     midi_note = MIDINote(
                         note_value=note_value,
                         note_name=note_name,
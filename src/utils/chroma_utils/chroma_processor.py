@@ -0,0 +1,131 @@
+import numpy as np
+
+from typing import Optional
+
+from utils.shared_dcs import AudioPipeline, ChromaPipeline, AudioDecomp, ChromaResultSet
+from utils.keyidentifier import pitchdistribution as pd
+from utils.keyidentifier import classifiers
+from utils.chroma_utils.chroma_filters import ChromaFilter
+from utils.chroma_utils.chroma_cqt import TuningTracker
+from utils.chroma_utils.chroma_key_tracker import KeyAccumulator
+from utils.chroma_utils.chroma_beat_sync import BeatSync
+from utils.audio_utils.audio_pipeline import ChromaST
+from utils.audio_utils.audio_ingest import AudioIngest
+from utils.audio_utils.audio_filters import IIRFilterBank
+from utils.audio_utils.streaming_tempo import StreamingTempo, TEMPO_HISTORY_TIME
+
+
+class ChromaProcessor:
+    """
+    Accumulates chromagrams, key and BPM over consecutive audio chunks.
+    Free of Qt and matplotlib so it can run headless or in worker processes.
+    """
+
+    classifier = classifiers.NaiveBayes()
+
+    def __init__(
+        self,
+        adpl: AudioPipeline,
+        chpl: ChromaPipeline,
+        key_half_life: Optional[float] = None,
+        tempo_history: float = TEMPO_HISTORY_TIME,
+    ):
+        self.adpl = adpl
+        self.chpl = chpl
+        self.tempo_history = tempo_history
+
+        self.filter_bank = None
+        self.filter_sr = 0
+        self.tuning_tracker = TuningTracker()
+        self.key_accumulator = KeyAccumulator(key_half_life)
+        self.tempo_tracker = None
+        self.chroma_result = self.get_empty_chroma_result()
+
+    def update_adpl(self, adpl: AudioPipeline):
+        self.adpl = adpl
+        self.filter_bank = None
+        self.filter_sr = 0
+
+    def update_chpl(self, chpl: ChromaPipeline):
+        self.chpl = chpl
+
+    def get_filter_bank(self, sr: int):
+        if self.filter_bank is None or self.filter_sr != sr:
+            self.filter_bank = IIRFilterBank.from_adpl(self.adpl, sr)
+            self.filter_sr = sr
+        return self.filter_bank
+
+    def get_tempo_tracker(self, sr: int):
+        if self.tempo_tracker is None or self.tempo_tracker.sr != sr:
+            self.tempo_tracker = StreamingTempo(sr, self.tempo_history)
+        return self.tempo_tracker
+
+    def get_empty_chroma_result(self):
+        chroma_result = ChromaResultSet(
+            chromas=np.empty([12, 0]),
+            audio_array=np.empty([0,]),
+            key="",
+            probability=0,
+            bpm=0,
+        )
+        return chroma_result
+
+    def finish_chromagram(self, chromas, audio_decomp: AudioDecomp):
+        len_chroma_result = len(self.chroma_result.chromas[0])
+
+        if len_chroma_result > 1000:
+            self.chroma_result = self.get_empty_chroma_result()
+            # A decaying key outlives the displayed chromagram.
+            if self.key_accumulator.half_life is None:
+                self.key_accumulator.reset()
+
+        self.chroma_result.chromas = np.concatenate(
+            (self.chroma_result.chromas, chromas), axis=1
+        )
+        self.chroma_result.audio_array = np.concatenate(
+            (self.chroma_result.audio_array, audio_decomp.audio_array), axis=0
+        )
+
+        self.chroma_result.bpm = self.calculate_bpm(audio_decomp)
+        self.key_accumulator.update(chromas, BeatSync.get_column_times(audio_decomp))
+        key, probability = self.get_dist_key_probability(self.key_accumulator.get_distribution())
+        self.chroma_result.key = key
+        self.chroma_result.probability = probability
+
+    def calculate_bpm(self, audio_decomp: AudioDecomp):
+        # Only the new chunk is analysed; the tracker keeps the history.
+        tempo_tracker = self.get_tempo_tracker(int(audio_decomp.sample_rate))
+        bpm = tempo_tracker.update(audio_decomp.audio_array)
+        bpm = round(bpm, 2)
+        return bpm
+
+    def get_result(self):
+        return self.chroma_result
+
+    def update_chromagram_process(self, audio_io):
+        audio_buffer = AudioIngest.from_wav_io(audio_io)
+        filter_bank = self.get_filter_bank(audio_buffer.sample_rate)
+        chroma_st = ChromaST(self.adpl, filter_bank, self.tuning_tracker)
+        audio_decomp = chroma_st.get_audio_decomp(audio_buffer)
+        chromas = audio_decomp.chromas
+        p_chromas = self.process_chromas(chromas, BeatSync.get_frames_per_column(audio_decomp))
+        self.finish_chromagram(p_chromas, audio_decomp)
+
+    def process_chromas(self, chromas, frames_per_column: float = 1.0):
+        chroma_filter = ChromaFilter(chromas, copy=False, frames_per_column=frames_per_column)
+        chroma_filter.apply_pipeline(self.chpl)
+        p_chromas = chroma_filter.get()
+        return p_chromas
+
+    @classmethod
+    def get_key_probability(cls, chromas: np.ndarray) -> tuple[str, float]:
+        dist = pd.PitchDistribution.from_chromagram(chromas)
+        return cls.get_dist_key_probability(dist.to_array())
+
+    @classmethod
+    def get_dist_key_probability(cls, dist: np.ndarray) -> tuple[str, float]:
+        probabilities = cls.classifier.get_probabilities(dist)[0]
+        idx = int(probabilities.argmax())
+        key = classifiers.KEYS[idx]
+        probability = round(float(probabilities[idx]) * 100, 2)
+        return key, probability
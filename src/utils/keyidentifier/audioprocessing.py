@@ -3,13 +3,13 @@
 Tools for processing audio data
 """
 
-import librosa
-
 
 def chromagram_from_file(filename):
     """
     Takes path FILENAME to audio file and returns the file's chromagram C (numpy array with shape=(12, t=number time samples))
     """
+    import librosa
+
     y, sr = librosa.load(filename)
 
     # Separate harmonic component from percussive
@@ -19,5 +19,7 @@ def chromagram_from_file(filename):
     return C
 
 def chromagram_from_array(y, sr):
-    C = librosa.feature.chroma_cqt(y=y, sr=sr)
+    from utils.chroma_utils.chroma_cqt import chroma_cqt
+
+    C = chroma_cqt(y, sr, threshold=0.0)
     return C
@@ -5,12 +5,14 @@ Class PitchDistribution represents proportion of musical sample made up of each
 
 from utils.keyidentifier import audioprocessing as ap
 import numpy as np
-from decimal import Decimal
 
 NUM_NOTES = 12
 NOTES = ['A', 'A#', 'B', 'C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#']
 INTERVALS = ['P1', 'm2', 'M2', 'm3', 'M3', 'P4', 'd5', 'P5', 'm6', 'M6', 'm7', 'M7']
 SCALES = ['major', 'minor']
+NOTE_INDEX = {note: i for i, note in enumerate(NOTES)}
+# Position of C, the first chromagram row, in NOTES
+CHROMAGRAM_OFFSET = NOTES.index('C')
 # 'Typical' pitch distributions [A, A#, B, ..., G#] for major, minor scales with tonic A,
 # adapted for use with other tonal centers by rotating.
 MAJOR_SCALE_PROFILE = [0.16, 0.03, 0.09, 0.03, 0.13, 0.10, 0.06, 0.14, 0.03, 0.11, 0.03, 0.09]
@@ -72,127 +74,76 @@ class Key(object):
 
 class PitchDistribution(object):
     """
-    Distribution over pitch classes A, A#, ..., G, G# in the form of a map NOTES --> [0,1]
+    Distribution over pitch classes A, A#, ..., G, G# in the form of a map NOTES --> [0,1],
+    held as a 12-element array in NOTES order
     """
     def __init__(self, values_array=None):
         """
         Initializes empty distribution.
         """
-        self.distribution = {}
-        if values_array:
+        self.distribution = np.zeros(NUM_NOTES, dtype=np.float64)
+        if values_array is not None and len(values_array):
             assert len(values_array) == NUM_NOTES, "Distribution must have %d notes, %d provided" % (NUM_NOTES, len(values_array))
-            for i in range(NUM_NOTES):
-                note = NOTES[i]
-                val = values_array[i]
-                self.set_val(note, val)
+            self.distribution[:] = np.asarray(values_array, dtype=np.float64)
             self.normalize()
 
     @classmethod
-    def from_file(cls, filename):
+    def from_file(cls, filename, weighted=False):
         """
         Given path FILENAME to audio file, return its PitchDistribution
         """
-        def chromagram_index_to_note(i):
-            """
-            Given row index in librosa chromagram, returns note it represents
-            """
-            return skip_interval('C', INTERVALS[i])
-
         C = ap.chromagram_from_file(filename)
-
-        # Pick out only most prominent note in each time interval
-        single_note_reduction = C.argmax(axis=0)
-
-        dist = PitchDistribution()
-        for i in np.nditer(single_note_reduction):
-            note = chromagram_index_to_note(i)
-            dist.increment_val(note)
-        dist.normalize()
-        return dist
-
+        return cls.from_chromagram(C, weighted)
 
     @classmethod
-    def from_array(cls, y, sr):
+    def from_array(cls, y, sr, weighted=False):
         """
-        Given path FILENAME to audio file, return its PitchDistribution
+        Given audio samples Y at sample rate SR, return their PitchDistribution
         """
-        def chromagram_index_to_note(i):
-            """
-            Given row index in librosa chromagram, returns note it represents
-            """
-            return skip_interval('C', INTERVALS[i])
-
         C = ap.chromagram_from_array(y, sr)
-
-        # Pick out only most prominent note in each time interval
-        single_note_reduction = C.argmax(axis=0)
-
-        dist = PitchDistribution()
-        for i in np.nditer(single_note_reduction):
-            note = chromagram_index_to_note(i)
-            dist.increment_val(note)
-        dist.normalize()
-        return dist
+        return cls.from_chromagram(C, weighted)
 
     @classmethod
-    def from_chromagram(cls, C):
+    def from_chromagram(cls, C, weighted=False):
         """
-        Given path FILENAME to audio file, return its PitchDistribution
+        Given chromagram C (rows C, C#, ..., B), return its PitchDistribution.
+        Counts the most prominent note in each time interval, or sums the
+        energy of every note over time if WEIGHTED.
         """
-        def chromagram_index_to_note(i):
-            """
-            Given row index in librosa chromagram, returns note it represents
-            """
-            return skip_interval('C', INTERVALS[i])
-
-        # Pick out only most prominent note in each time interval
-        single_note_reduction = C.argmax(axis=0)
-
-
-        # dist = PitchDistribution()
-        # iter = 0
-        # for i in C:
-        #     for ii in i:
-        #         if ii > 0.001:
-        #             note = chromagram_index_to_note(iter)
-        #             dist.increment_val(note)
-        #     iter += 1
-        # dist.normalize()
-
-        dist = PitchDistribution()
-        for i in np.nditer(single_note_reduction):
-            note = chromagram_index_to_note(i)
-            dist.increment_val(note)
+        C = np.asarray(C)
+        if weighted:
+            values = C.sum(axis=1, dtype=np.float64)
+        else:
+            values = np.bincount(C.argmax(axis=0), minlength=NUM_NOTES).astype(np.float64)
+
+        # Chromagram rows start at C, three semitones above A
+        dist = cls()
+        dist.distribution[:] = np.roll(values, CHROMAGRAM_OFFSET)
         dist.normalize()
-
         return dist
 
     def __str__(self):
         return str([(note, self.get_val(note)) for note in NOTES])
 
     def to_array(self):
-        return [self.get_val(note) for note in NOTES]
+        return self.distribution
 
     def set_val(self, note, val):
-        self.distribution[note] = Decimal(val)
+        self.distribution[NOTE_INDEX[note]] = val
 
     def get_val(self, note):
-        if note in self.distribution:
-            return self.distribution[note]
-        return Decimal(0.0)
+        return float(self.distribution[NOTE_INDEX[note]])
 
     def increment_val(self, note):
         """
         Increments value of note NOTE in a distribution
         """
-        self.set_val(note, self.get_val(note) + 1)
+        self.distribution[NOTE_INDEX[note]] += 1
 
     def normalize(self):
         """
         Normalize distribution so that all entries sum to 1
         """
-        distribution_sum = sum(self.distribution.values())
+        distribution_sum = self.distribution.sum()
         if distribution_sum != 0:
-            for note in NOTES:
-                val = self.get_val(note)
-                self.set_val(note, Decimal(val) / Decimal(distribution_sum))
+            self.distribution /= distribution_sum
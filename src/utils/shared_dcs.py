@@ -1,5 +1,6 @@
 import numpy as np
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Optional
 
 
 @dataclass
@@ -17,12 +18,29 @@ class MIDINote:
     offset: float
 
 
+@dataclass
+class AudioBuffer:
+    samples: np.ndarray
+    sample_rate: int
+
+
 @dataclass
 class AudioDecomp:
     chromas: np.ndarray
     audio_array: np.ndarray
     sample_rate: float
     bpm: float
+    # Boundary times in seconds of beat-synchronous chroma columns, one more
+    # than the columns. None when the columns are STFT frames.
+    column_times: Optional[np.ndarray] = None
+
+
+@dataclass
+class AudioSpectra:
+    samples: np.ndarray
+    sample_rate: int
+    stft: Optional[np.ndarray] = None
+    onset_envelope: Optional[np.ndarray] = None
 
 
 @dataclass
@@ -34,6 +52,14 @@ class ChromaResultSet:
     bpm: float
 
 
+@dataclass
+class KeySegment:
+    start: float
+    end: float
+    key: str
+    confidence: float
+
+
 @dataclass
 class AudioPipeline:
     hpass_fl_state: bool
@@ -44,6 +70,10 @@ class AudioPipeline:
     save_out_state: bool
     calc_bpm_state: bool
     core_count: int
+    par_chroma_state: bool = True
+    chroma_backend: str = "cqt"
+    beat_sync_state: bool = False
+    beat_sync_val: int = 1
 
 
 @dataclass
@@ -54,3 +84,59 @@ class ChromaPipeline:
     mds_val: float
     min_clip_fl_state: bool
     min_clip_val: float
+
+
+@dataclass
+class SharedArraySpec:
+    name: str
+    shape: tuple[int, ...]
+    dtype: str
+
+
+@dataclass
+class LibrLoadJob:
+    adpl: AudioPipeline
+    sample_rate: int
+    in_spec: SharedArraySpec
+    start: int
+    end: int
+    out_spec: SharedArraySpec
+    out_start: int
+    out_end: int
+    out_offset: int
+
+
+@dataclass
+class ChromaCQTJob:
+    sample_rate: int
+    tuning: float
+    bins_per_octave: int
+    threshold: float
+    in_spec: SharedArraySpec
+    start: int
+    end: int
+    out_spec: SharedArraySpec
+    frame_start: int
+    frame_end: int
+
+
+@dataclass
+class BatchJob:
+    file_path: str
+    adpl: AudioPipeline
+    chpl: ChromaPipeline
+    chroma_dir: Optional[str]
+    midi_dir: Optional[str]
+    key_track: bool = False
+
+
+@dataclass
+class BatchResult:
+    file_path: str
+    key: str
+    probability: float
+    bpm: float
+    chroma_path: str
+    midi_path: str
+    error: str
+    key_segments: list[KeySegment] = field(default_factory=list)
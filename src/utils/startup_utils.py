@@ -0,0 +1,140 @@
+import time
+import logging
+import importlib
+
+
+# Cold start, from process start to the first painted window, must stay
+# under this budget. Anything not needed for the first paint is deferred.
+STARTUP_BUDGET_MS = 1500
+
+# Heavy modules loaded in the background once the main window is shown.
+# pyplot and anything importing it stay on the GUI thread.
+DEFERRED_MODULES = [
+    "numpy",
+    "scipy.signal",
+    "scipy.ndimage",
+    "soundfile",
+    "pydub",
+    "librosa",
+    "matplotlib.figure",
+]
+
+
+class StartupTimer:
+    """
+    Records named startup phases relative to the timer's creation and
+    reports them against STARTUP_BUDGET_MS.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks: list[tuple[str, float]] = []
+
+    def mark(self, phase: str):
+        elapsed_ms = (time.perf_counter() - self.start) * 1000
+        self.marks.append((phase, elapsed_ms))
+
+    def get_elapsed_ms(self) -> float:
+        if not self.marks:
+            return 0.0
+        return self.marks[-1][1]
+
+    def report(self, budget_ms: float = STARTUP_BUDGET_MS) -> str:
+        lines = ["Startup report:"]
+        previous_ms = 0.0
+        for phase, elapsed_ms in self.marks:
+            phase_ms = elapsed_ms - previous_ms
+            lines.append(f"  {phase:<24}{phase_ms:>9.1f} ms{elapsed_ms:>10.1f} ms")
+            previous_ms = elapsed_ms
+        lines.append(f"  {'budget':<24}{'':>12}{budget_ms:>10.1f} ms")
+        report = "\n".join(lines)
+
+        if self.get_elapsed_ms() > budget_ms:
+            logging.warning(report)
+        else:
+            logging.info(report)
+        return report
+
+
+def preload_modules(modules: list[str] = DEFERRED_MODULES) -> dict[str, float]:
+    """
+    Import MODULES, returning the time each one took in milliseconds.
+    Modules which were already loaded report close to zero.
+    """
+    import_times = {}
+    for module in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(module)
+        except ImportError as error:
+            logging.warning(f"preload_modules: {module} failed: {error}")
+            continue
+        import_times[module] = (time.perf_counter() - start) * 1000
+
+    lines = ["Deferred import report:"]
+    for module, elapsed_ms in import_times.items():
+        lines.append(f"  {module:<24}{elapsed_ms:>9.1f} ms")
+    logging.info("\n".join(lines))
+    return import_times
+
+
+def get_warm_up_buffer(sr: int, seconds: float):
+    import numpy as np
+    from utils.shared_dcs import AudioBuffer, AudioPipeline
+
+    rng = np.random.default_rng(0)
+    samples = 0.1 * rng.standard_normal((1, int(sr * seconds)), dtype=np.float32)
+    adpl = AudioPipeline(
+        hpass_fl_state=True,
+        hpass_val=1000,
+        lpass_fl_state=True,
+        lpass_val=2000,
+        inst_fl_state=True,
+        save_out_state=False,
+        calc_bpm_state=True,
+        core_count=1,
+    )
+    return AudioBuffer(samples, sr), adpl
+
+
+def warm_up_worker(sr: int, seconds: float):
+    """
+    Run the stages of the pool's jobs, HPSS and chroma_cqt, in this worker.
+    """
+    from utils.audio_utils.audio_pipeline import ChromaMT
+    from utils.chroma_utils.chroma_cqt import chroma_cqt
+
+    audio_buffer, adpl = get_warm_up_buffer(sr, seconds)
+    y, y_sr = ChromaMT(adpl).libr_load(audio_buffer.samples[0], sr)
+    chroma_cqt(y, y_sr)
+
+
+def warm_up_pool(processes: int, sr: int = 44100, seconds: float = 4.0):
+    """
+    Start the AnalysisPool with each worker running warm_up_worker as it
+    starts, as spawned workers share nothing compiled with this process.
+    Returns without waiting for the workers. Call from a normal priority
+    thread, on Linux workers keep the scheduling class of their creator.
+    """
+    from utils.audio_utils.analysis_pool import AnalysisPool
+
+    AnalysisPool.initializer = warm_up_worker
+    AnalysisPool.initargs = (sr, seconds)
+    AnalysisPool.get_pool(processes)
+
+
+def warm_up_analysis(sr: int = 44100, seconds: float = 4.0) -> float:
+    """
+    Run the serial analysis chain once over synthetic audio so numba compiles
+    librosa's jitted helpers before the first real analysis. Returns the time
+    taken in milliseconds.
+    """
+    from utils.audio_utils.audio_pipeline import ChromaST
+
+    start = time.perf_counter()
+    audio_buffer, adpl = get_warm_up_buffer(sr, seconds)
+    ChromaST(adpl).get_audio_decomp(audio_buffer)
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    logging.info(f"warm_up_analysis: {elapsed_ms:.1f} ms")
+    return elapsed_ms
@@ -2,7 +2,6 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 from pathlib import Path
-from copy import deepcopy
 from librosa.display import specshow
 
 from PyQt6.QtCore import QThreadPool
@@ -13,13 +12,18 @@ from utils.keyidentifier import pitchdistribution as pd
 from utils.keyidentifier import classifiers
 from utils.midi_utils.midi_converter import PianoRollMIDI
 from utils.chroma_utils.chroma_pianoroll import ChromaPianoRoll
-from utils.shared_dcs import AudioDecomp
-from utils.chroma_utils.chroma_filters import ChromaFilter
+from utils.shared_dcs import AudioDecomp, ChromaPipeline
+from utils.chroma_utils.chroma_filters import ChromaFilterCache
+from utils.chroma_utils.chroma_key_tracker import KeyTracker
+from utils.chroma_utils.chroma_beat_sync import BeatSync
 
 from utils.qrunnable_utils import GeneralWorker
 
 
 class ChromaDialog(QWidget):
+    classifier = classifiers.NaiveBayes()
+    key_tracker = KeyTracker()
+
     def __init__(self):
         super().__init__()
         self.ui = Ui_Dialog()
@@ -30,10 +34,13 @@ class ChromaDialog(QWidget):
         self.show()
 
         self.keys = ""
+        self.key_segments = []
         self.bpm = 0
         self.sr = 0
 
         self.audio_decomp = audio_decomp
+        frames_per_column = BeatSync.get_frames_per_column(audio_decomp)
+        self.filter_cache = ChromaFilterCache(audio_decomp.chromas, frames_per_column)
         self.ui.updateChroma.setEnabled(False)
         self.ui.showChroma.clicked.connect(self.show_chromagram)
         self.ui.updateChroma.clicked.connect(self.update_chromagram)
@@ -58,9 +65,27 @@ class ChromaDialog(QWidget):
     def finish_chromagram(self, chromas):
         self.enable_buttons()
         self.ax.set(title=f"Keys: {self.keys} - BPM: {self.bpm}")
-        specshow(chromas, y_axis="chroma", x_axis="time", ax=self.ax, sr=int(self.sr))
+        # Beat-synchronous columns are drawn between their real boundaries.
+        x_coords = self.audio_decomp.column_times
+        specshow(
+            chromas, y_axis="chroma", x_axis="time", x_coords=x_coords, ax=self.ax, sr=int(self.sr)
+        )
+        self.draw_key_segments()
         plt.pause(0.0001)
 
+    def draw_key_segments(self):
+        # A single segment is already the title's first key.
+        if len(self.key_segments) < 2:
+            return
+        transform = self.ax.get_xaxis_transform()
+        for segment in self.key_segments:
+            if segment.start > 0:
+                self.ax.axvline(segment.start, color="white", linewidth=1)
+            self.ax.text(
+                segment.start, 0.98, f" {segment.key}", transform=transform,
+                color="white", fontsize="small", verticalalignment="top",
+            )
+
     def update_chromagram(self):
         self.disable_buttons()
         worker = GeneralWorker(self.update_chromagram_process)
@@ -70,29 +95,28 @@ class ChromaDialog(QWidget):
     def update_chromagram_process(self):
         chromas = self.process_chromas()
         self.keys = self.get_key_probability(chromas)
+        column_times = BeatSync.get_column_times(self.audio_decomp)
+        self.key_segments = self.key_tracker.track(chromas, column_times)
         self.bpm = self.audio_decomp.bpm
         self.sr = self.audio_decomp.sample_rate
         return chromas
 
-    def process_chromas(self):
-        chromas = deepcopy(self.audio_decomp.chromas)
-        chroma_filter = ChromaFilter(chromas)
-
-        if self.ui.absoluteFilter.isChecked():
-            chroma_filter.abs_filter()
-
-        if self.ui.nnFilter.isChecked():
-            chroma_filter.nn_filter()
-
-        if self.ui.mSmoothingFilter.isChecked():
-            smoothing_value = int(self.ui.mSmoothingValue.text())
-            chroma_filter.smoothing_filter(smoothing_value)
-
-        if self.ui.minClipFilter.isChecked():
-            min_clip = float(self.ui.minClipValue.text())
-            chroma_filter.clip_filter(min_clip)
+    def get_chpl(self) -> ChromaPipeline:
+        mds_fl_state = self.ui.mSmoothingFilter.isChecked()
+        min_clip_fl_state = self.ui.minClipFilter.isChecked()
+        chpl = ChromaPipeline(
+            abs_fl_state=self.ui.absoluteFilter.isChecked(),
+            nn_fl_state=self.ui.nnFilter.isChecked(),
+            mds_fl_state=mds_fl_state,
+            mds_val=int(self.ui.mSmoothingValue.text()) if mds_fl_state else 0,
+            min_clip_fl_state=min_clip_fl_state,
+            min_clip_val=float(self.ui.minClipValue.text()) if min_clip_fl_state else 0,
+        )
+        return chpl
 
-        p_chromas = chroma_filter.get()
+    def process_chromas(self):
+        # Only the stages after the first changed setting are rerun.
+        p_chromas = self.filter_cache.apply_pipeline(self.get_chpl())
         return p_chromas
 
     def save_midi(self):
@@ -111,25 +135,15 @@ class ChromaDialog(QWidget):
         sr = self.audio_decomp.sample_rate
         bpm = self.audio_decomp.bpm
 
-        piano_roll = ChromaPianoRoll(chromas, int(sr)).get_piano_roll()
+        column_times = self.audio_decomp.column_times
+        piano_roll = ChromaPianoRoll(chromas, int(sr), column_times).get_piano_roll()
         midi_file = PianoRollMIDI(piano_roll, bpm).get_midi_file()
 
         with open(filepath, "wb") as f:
             midi_file.writeFile(f)
 
     def get_key_probability(self, chromas: np.ndarray):
-        naive_bayes = classifiers.NaiveBayes()
         dist = pd.PitchDistribution.from_chromagram(chromas)
-        keys = []
-        key_probs = {}
-        for note in pd.NOTES:
-            for scale in pd.SCALES:
-                keys.append(f"{note} {scale}")
-
-        for key in keys:
-            key_likelihood = naive_bayes.get_key_likelihood(key, dist)
-            key_probs.update({key: key_likelihood})
-
-        key_probs = dict(sorted(key_probs.items(), key=lambda x: x[1], reverse=True))
-        top_key_probs = list(key_probs.keys())[:3]
+        probabilities = self.classifier.get_probabilities(dist)[0]
+        top_key_probs = [classifiers.KEYS[idx] for idx in np.argsort(-probabilities)[:3]]
         return top_key_probs
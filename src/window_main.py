@@ -1,24 +1,21 @@
 import os
 import logging
 from io import BytesIO
-from pydub import AudioSegment
 from multiprocessing import cpu_count
 
 import traceback
-from PyQt6.QtCore import QThreadPool, QBuffer, QIODevice, QByteArray
+from PyQt6.QtCore import QThread, QThreadPool, QBuffer, QIODevice, QByteArray, QTimer
 from PyQt6.QtWidgets import QMainWindow
 from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
 
 from utils.qrunnable_utils import GeneralWorker
 from utils.audio_utils.audio_pipeline import ChromaMT
-from utils.audio_utils.audio_devices import AudioDevices
-from utils.audio_utils.audio_recorder import AudioRecorder
-from utils.shared_dcs import AudioPipeline
+from utils.audio_utils.audio_ingest import AudioIngest
+from utils.shared_dcs import AudioBuffer, AudioPipeline
+from utils.startup_utils import StartupTimer, preload_modules, warm_up_analysis, warm_up_pool
 
 
 from ui.musicui import Ui_MainWindow
-from window_chroma import ChromaDialog
-from window_realtime_chroma import RealTimeWindow
 
 
 
@@ -44,6 +41,37 @@ class Main(QMainWindow):
         cls.audio_processor = AudioProcessor()
         return instance
 
+    def start_deferred_loading(
+        self, startup_timer: StartupTimer, warm_up_state: bool = True, warm_up_pool_state: bool = False
+    ):
+        # Runs once the event loop has painted the window.
+        self.warm_up_state = warm_up_state
+        self.warm_up_pool_state = warm_up_pool_state
+        QTimer.singleShot(0, lambda: self.deferred_loading(startup_timer))
+
+    def deferred_loading(self, startup_timer: StartupTimer):
+        startup_timer.mark("first paint")
+        startup_timer.report()
+
+        self.audio_player.load_audio_devices()
+        if self.warm_up_pool_state:
+            # Started here rather than in background_loading, whose idle
+            # priority the workers would inherit.
+            warm_up_pool(cpu_count())
+        worker = GeneralWorker(self.background_loading)
+        self.audio_player.threadpool.start(worker)
+
+    def background_loading(self):
+        thread = QThread.currentThread()
+        priority = thread.priority()
+        thread.setPriority(QThread.Priority.IdlePriority)
+        try:
+            preload_modules()
+            if self.warm_up_state:
+                warm_up_analysis()
+        finally:
+            thread.setPriority(priority)
+
     def dragEnterEvent(self, event):
         if event.mimeData().hasUrls():
             event.accept()
@@ -78,8 +106,7 @@ class AudioPlayer(Main):
         self.mediaPlayer.errorOccurred.connect(self.media_error)
         self.mediaPlayer.durationChanged.connect(self.media_duration_changed)
 
-        self.audioDevices = self.getAudioDevices()
-        self.insertDevicesIntoList()
+        self.audioDevices = []
         self.ui.playButton.setEnabled(False)
         self.ui.pauseButton.setEnabled(False)
         self.currentFile = None
@@ -88,6 +115,7 @@ class AudioPlayer(Main):
         self.ui.pauseButton.setEnabled(False)
         self.ui.stopRecordButton.setEnabled(False)
         self.ui.startProcessingButton.setEnabled(False)
+        self.ui.recordButton.setEnabled(False)
 
         self.threadpool = QThreadPool()
 
@@ -119,19 +147,21 @@ class AudioPlayer(Main):
         logging.info(f"MediaStatus changed: {status}")
 
     def load_audio_file(self, file: str):
-        audio_io = BytesIO()
-        audio_file = AudioSegment.from_file(file)
-        audio_file.export(audio_io, format="wav", codec="pcm_s16le")
-        self.load_audio_io(audio_io)
+        audio_buffer = AudioIngest.from_file(file)
+        self.load_audio_buffer(audio_buffer)
 
     def load_audio_io(self, audio_io: BytesIO):
+        audio_buffer = AudioIngest.from_wav_io(audio_io)
+        self.load_audio_buffer(audio_buffer)
+
+    def load_audio_buffer(self, audio_buffer: AudioBuffer):
         self.buf = QBuffer()
-        self.file_bytearray = QByteArray().append(audio_io.getvalue())
+        self.file_bytearray = QByteArray(AudioIngest.to_wav_bytes(audio_buffer))
         self.buf.setBuffer(self.file_bytearray)
         self.buf.open(QIODevice.OpenModeFlag.ReadOnly)
         self.mediaPlayer.setSourceDevice(self.buf)
 
-        self.currentFile = audio_io
+        self.currentFile = audio_buffer
         self.ui.playButton.setEnabled(True)
         self.ui.pauseButton.setEnabled(True)
         self.ui.startProcessingButton.setEnabled(True)
@@ -177,7 +207,20 @@ class AudioPlayer(Main):
         hours, mins = divmod(mins, 60)
         return "%02d:%02d:%02d" % (hours, mins, secs)
 
+    def load_audio_devices(self):
+        worker = GeneralWorker(self.getAudioDevices)
+        worker.signals.output.connect(self.set_audio_devices)
+        worker.signals.error.connect(self.recorder_error)
+        self.threadpool.start(worker)
+
+    def set_audio_devices(self, audio_devices):
+        self.audioDevices = audio_devices
+        self.insertDevicesIntoList()
+        self.ui.recordButton.setEnabled(bool(audio_devices))
+
     def getAudioDevices(self):
+        from utils.audio_utils.audio_devices import AudioDevices
+
         audio_devices = AudioDevices()
         wasapi_devices = audio_devices.get_wasapi_devices()
         wasapi_ins = audio_devices.filter_to_input_devices(wasapi_devices)
@@ -192,6 +235,9 @@ class AudioPlayer(Main):
         logging.warning(f"AudioRecorder Error: {error}")
 
     def recordAudio(self):
+        from utils.audio_utils.audio_recorder import AudioRecorder
+        from window_realtime_chroma import RealTimeWindow
+
         self.stop_audio()
         self.reset_functions()
         self.switch_thread_status()
@@ -252,7 +298,7 @@ class AudioProcessor(AudioPlayer):
         self.ui.startProcessingButton.setText("Processing..")
 
     def completedState(self):
-        self.ui.recordButton.setEnabled(True)
+        self.ui.recordButton.setEnabled(bool(self.audioDevices))
         self.ui.saveOutputCheckbox.setEnabled(True)
         self.ui.highPassCheckbox.setEnabled(True)
         self.ui.lowPassCheckbox.setEnabled(True)
@@ -261,6 +307,8 @@ class AudioProcessor(AudioPlayer):
         self.ui.startProcessingButton.setText("Start Processing")
 
     def audh_output(self, chromas):
+        from window_chroma import ChromaDialog
+
         self.completedState()
         self.dialog_window = ChromaDialog()
         self.dialog_window.show_window(chromas)
@@ -286,7 +334,7 @@ class AudioProcessor(AudioPlayer):
             inst_fl_state=self.ui.instrumentFilterCheckbox.isChecked(),
             save_out_state=self.ui.saveOutputCheckbox.isChecked(),
             calc_bpm_state=True,
-            core_count=6,
+            core_count=self.threadcount,
         )
 
         audioHandler = ChromaMT(adpl)
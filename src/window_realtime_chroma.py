@@ -7,7 +7,7 @@ from PyQt6.QtGui import QImage, QPixmap
 
 from utils.shared_dcs import AudioPipeline, ChromaPipeline
 from utils.qrunnable_utils import GeneralWorker, GeneralWorkerCallback
-from utils.audio_utils.audio_recorder import AudioRecorder, ChromaProcessor
+from utils.audio_utils.audio_recorder import AudioRecorder, LiveChromaProcessor
 
 from ui.realtime_chroma_ui import Ui_Form
 
@@ -32,7 +32,7 @@ class RealTimeWindow(QWidget):
         self.chpl = self.get_chpl_ui()
 
         self.ui.applySettings.clicked.connect(self.set_adpl_chpl)
-        self.chroma_processor = ChromaProcessor(self.adpl, self.chpl)
+        self.chroma_processor = LiveChromaProcessor(self.adpl, self.chpl)
         self.audio_recorder = audio_recorder
         self.scene = QGraphicsScene()
         self.ui.graphicsChroma.setScene(self.scene)